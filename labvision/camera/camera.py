@@ -1,4 +1,6 @@
 from types import NoneType
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import sys
 import os
@@ -37,6 +39,10 @@ class Camera:
 
     img = cam.get_frame()
 
+    In asyncio code capture without blocking the event loop:
+
+    img = await cam.get_frame_async()
+
     '''
 
     def __init__(self, cam_num=None, cam_type: Optional[CameraType] = None, frame_size: Tuple[int, int, int] = None, fps: Optional[float] = None, snap: bool = True):
@@ -48,6 +54,7 @@ class Camera:
         self.set = self.cam.set
         self.get = self.cam.get
         self.snap = snap
+        self._executor = None
 
         
         if frame_size is None:
@@ -88,8 +95,19 @@ class Camera:
             raise CamReadError(self.cam, frame)
         return frame
 
+    async def get_frame_async(self, retry=3):
+        """Get a frame from the camera without blocking the asyncio event loop.
+        Capture runs in a dedicated thread so calls are made one at a time."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.get_frame, retry)
+
     def close(self):
         """Release the OpenCV camera instance"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
         self.cam.release()
 
     def get_property(self, property: CameraProperty = CameraProperty.WIDTH):
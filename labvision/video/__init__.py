@@ -1,20 +1,73 @@
 import os
+import asyncio
+import queue
+import threading
+import collections.abc
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
 import cv2
 import numpy as np
-from slicerator import Slicerator
+from slicerator import Slicerator, key_to_indices
 from filehandling import BatchProcess, smart_number_sort
 from labvision import images
-from typing import Optional, Tuple
+from .img_headers import read_img_header
+from .archive import ArchiveWriter, _ReadArchive, ARCHIVE_FILE_EXT
+from .pipeline import Pipeline, Stage
+from .background_models import MeanBackground, QuantileBackground, MOGBackground, subtract_background
+from .stats import Stats
+from typing import List, Optional, Tuple, Union
 import datetime
 
 IMG_FILE_EXT = ('.png', '.jpg', '.tiff', '.JPG', '.PNG', '.TIFF')
 VID_FILE_EXT = ('.MP4', '.mp4', '.m4v', '.avi', '.mkv', '.webm')
+RAW_FILE_EXT = ('.npy',)
+
+# GOP size assumed when it can't be measured from a seek_index
+DEFAULT_GOP_SIZE = 12
+
+# number of seeks and grabbed frames timed before their measured costs replace the defaults
+MIN_COST_SAMPLES = 3
+
+# cv2.imread flags for each downscale factor, (colour, grayscale)
+_IMREAD_FLAGS = {1: (cv2.IMREAD_COLOR, cv2.IMREAD_GRAYSCALE),
+                 2: (cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+                 4: (cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                 8: (cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_GRAYSCALE_8)}
+
+# maps studio range luma (16-235) onto the full 0-255 range of a grayscale image
+_LUMA_TO_GRAY = np.clip(np.round((np.arange(256) - 16)*255/219), 0, 255).astype(np.uint8)
+
+# 8 bit 4:2:0 pixel formats, as reported by CAP_PROP_CODEC_PIXEL_FORMAT, whose first plane is luma
+_LUMA_PIXEL_FORMATS = ('I420', 'NV12')
+
+# codecs decoded to full range yuv (yuvj420p) which OpenCV also reports as I420
+_FULL_RANGE_CODECS = ('MJPG', 'mjpg', 'JPEG', 'jpeg', 'LJPG', 'AVRN', 'dmb1')
 
 """type hints"""
 FrameRange = Tuple[int, Optional[int], int]
 
 
-__all__ = ['ReadVideo', 'WriteVideo', 'video_to_imgs', 'imgs_to_video']
+__all__ = ['ReadVideo', 'WriteVideo', 'video_to_imgs', 'imgs_to_video', 'parallel_map', 'probe_img_seq',
+           'video_to_npy', 'ArchiveWriter', 'Pipeline', 'Stage', 'background', 'subtract_background']
+
+# metadata of img sequences already probed, see _probe_img_files
+_IMG_SEQ_METADATA = {}
+
+
+def _fourcc_to_str(value: float):
+    """Converts a fourcc code returned by VideoCapture.get to a string"""
+    value = int(value)
+    return ''.join(chr((value >> 8*i) & 0xFF) for i in range(4)) if value > 0 else ''
+
+
+def _capture_has_luma(cap):
+    """True if cap is an FFmpeg capture of an 8 bit 4:2:0 stream which isn't jpeg
+    based. OpenCV doesn't report the colour range so jpeg based codecs, which
+    decode to full range, are excluded and other codecs are assumed studio range."""
+    return (cap.getBackendName() == 'FFMPEG') and \
+        (_fourcc_to_str(cap.get(cv2.CAP_PROP_CODEC_PIXEL_FORMAT)) in _LUMA_PIXEL_FORMATS) and \
+        (_fourcc_to_str(cap.get(cv2.CAP_PROP_FOURCC)) not in _FULL_RANGE_CODECS)
 
 
 class _ReadImgSeq:
@@ -25,30 +78,92 @@ class _ReadImgSeq:
     This can be a 1, 01,001 or a 00001, 0010, 0100 format. If you send
     one example file it will try and find all the other similarly named
     but differently numbered files in the folder.
+
+    If workers > 0 upcoming files are decoded ahead in a pool of that many threads
+    (cv2.imread releases the GIL). Files are still returned in order and the
+    read-ahead follows the stride between successive reads.
+
+    If grayscale files are decoded straight to grayscale. If downscale is 2, 4
+    or 8 files are decoded at reduced size, which for jpgs is much less work.
     """
 
-    def __init__(self, file_filter: str):
+    def __init__(self, file_filter: str, workers: int = 0, grayscale: bool = False, downscale: int = 1):
         self.ext = '.'+file_filter.split('.')[1]
 
         assert self.ext in IMG_FILE_EXT, 'Extension not recognised'
 
         self.files = BatchProcess(file_filter, smart_sort=smart_number_sort)
-        ret, im = self.read()
-        self.set("", 0)
-        assert ret, 'Failed to read file'
-        self.frame_size = np.shape(im)
+        assert downscale in _IMREAD_FLAGS, 'downscale must be 1, 2, 4 or 8'
+        self.imread_flags = _IMREAD_FLAGS[downscale][int(grayscale)]
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers) if workers else None
+        self._pending = {}
+        self._last_index = None
+        self._stride = 1
+        self.metadata = _probe_img_files(self.files.files)
+        if self.metadata is None:
+            ret, im = self.read()
+            self.set("", 0)
+            assert ret, 'Failed to read file'
+            self.frame_size = np.shape(im)[:2] + (3,)
+        else:
+            # cv2.imread returns 8 bit, 3 channel images whatever is stored
+            self.frame_size = (self.metadata['height'], self.metadata['width'], 3)
         self.colour = int(self.frame_size[2])
 
+    def timestamps(self):
+        """Returns the time of each file in seconds. These are read from a sidecar
+        file, timestamps.txt in the same folder with one time per line, if there is
+        one with a line for every file, otherwise from the file modification times
+        relative to the first file."""
+        sidecar = os.path.join(os.path.dirname(self.files.files[0]), 'timestamps.txt')
+        if os.path.exists(sidecar):
+            times = np.loadtxt(sidecar, ndmin=1)
+            if len(times) == self.files.num_files:
+                return times
+        times = np.array([os.path.getmtime(filename) for filename in self.files.files])
+        return times - times[0]
+
+    def check_frame_sizes(self):
+        """Reads the header of every file in the sequence. Returns True if all
+        the files have the same size and prints a warning if they don't."""
+        self.metadata = _probe_img_files(self.files.files, check_all=True)
+        return self.metadata['uniform_size']
+
     def read(self):
         """read a file"""
+        index = self.files.current
         filename = next(self.files)
-        im = cv2.imread(filename)
+        if self._executor is None:
+            im = self._imread(filename)
+        else:
+            self._read_ahead(index)
+            im = self._pending.pop(index).result()
         if np.size(im) == 1:
             ret = False
         else:
             ret = True
         return ret, im
 
+    def _imread(self, filename):
+        return cv2.imread(filename, self.imread_flags)
+
+    def _read_ahead(self, index):
+        """Makes sure the files that will be read next, starting at index, are being
+        decoded by the thread pool and cancels any that are no longer needed.
+        The stride is signed so the window follows reading backwards too"""
+        if (self._last_index is not None) and (index != self._last_index):
+            self._stride = index - self._last_index
+        self._last_index = index
+        end = index + 2*self.workers*self._stride
+        window = range(index, min(end, self.files.num_files) if self._stride > 0 else max(end, -1), self._stride)
+        for i in list(self._pending):
+            if i not in window:
+                self._pending.pop(i).cancel()
+        for i in window:
+            if i not in self._pending:
+                self._pending[i] = self._executor.submit(self._imread, self.files.files[i])
+
     def set(self, dummy, frame_num: float):
         """set the pointer to the file with specified index. This is the index in the list of files
         discovered by BatchProcess"""
@@ -79,10 +194,432 @@ class _ReadImgSeq:
             else:
                 return False
 
+    def release(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._pending = {}
+
+
+class _ReadRawFrames:
+    """Read frames from a .npy file of stacked frames, eg written by video_to_npy,
+    is used by ReadVideo in the same way as _ReadImgSeq.
+
+    The file is memory mapped so each frame read is a view into the OS page
+    cache, with no decoding or copying, shared between processes reading the
+    same file.
+    """
+
+    def __init__(self, filename: str):
+        self.frames = np.load(filename, mmap_mode='r')
+        assert self.frames.ndim in (3, 4), 'npy file must have shape (N, H, W) or (N, H, W, C)'
+        self.frame_size = self.frames.shape[1:]
+        self.current = 0
+
+    def read(self):
+        """returns a read only view of the next frame"""
+        if self.current >= len(self.frames):
+            return False, None
+        im = self.frames[self.current]
+        self.current += 1
+        return True, im
+
+    def set(self, dummy, frame_num: float):
+        assert frame_num in range(len(self.frames)), 'Attempted to set frame num to impossible value'
+        self.current = int(frame_num)
+
+    def get(self, property):
+        if property == cv2.CAP_PROP_POS_FRAMES:
+            return self.current
+        elif property == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.frames)
+        elif property == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frame_size[1]
+        elif property == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frame_size[0]
+        elif property == cv2.CAP_PROP_MONOCHROME:
+            return len(self.frame_size) == 2
+        else:
+            return -1
+
     def release(self):
         pass
 
 
+class _ReadConcatVideo:
+    """Read several video files as one continuous video, is used by ReadVideo
+    in place of cv2.VideoCapture when given a list or glob of videos.
+
+    Frames are numbered globally across the files. Only the files being read
+    are opened and at most max_open are kept open, the least recently used
+    being released. Properties set, eg CAP_PROP_CONVERT_RGB, are applied to
+    every file as it is opened.
+
+    Frame counts come from each file's seek_index, which are exact, as the
+    CAP_PROP_FRAME_COUNT estimates would misplace the boundaries between files.
+    If seek_indexes aren't supplied each file is demuxed once when opened to count
+    its frames, using an existing sidecar index if there is one but not saving one.
+    """
+
+    def __init__(self, filenames, seek_indexes=None, max_open: int = 2):
+        self.filenames = filenames
+        self.max_open = max_open
+        self._captures = OrderedDict()
+        self._properties = {}
+        if seek_indexes is None:
+            seek_indexes = [_SeekIndex.load(filename) or _SeekIndex.build(filename) for filename in filenames]
+        self.seek_indexes = seek_indexes
+        counts = [index.num_frames for index in seek_indexes]
+        self.starts = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.num_frames = int(self.starts[-1])
+        self.current = 0
+        self.file_num = 0
+        self._capture(0)
+
+    def _capture(self, file_num: int):
+        """Returns the capture for file_num, opening it if needed and releasing
+        the least recently used captures beyond max_open"""
+        if file_num in self._captures:
+            self._captures.move_to_end(file_num)
+        else:
+            cap = cv2.VideoCapture(self.filenames[file_num])
+            for property, value in self._properties.items():
+                cap.set(property, value)
+            self._captures[file_num] = cap
+            while len(self._captures) > self.max_open:
+                _, old_cap = self._captures.popitem(last=False)
+                old_cap.release()
+        return self._captures[file_num]
+
+    def _next_capture(self):
+        """Returns the capture to read the frame at current from, moving on
+        to the next file at the end of each file"""
+        if (self.current >= self.starts[self.file_num + 1]) and (self.file_num + 1 < len(self.filenames)):
+            self.file_num += 1
+            cap = self._capture(self.file_num)
+            if cap.get(cv2.CAP_PROP_POS_FRAMES) != 0:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            return cap
+        return self._capture(self.file_num)
+
+    def read(self, image=None):
+        cap = self._next_capture()
+        ret, im = cap.read() if image is None else cap.read(image)
+        self.current += 1
+        return ret, im
+
+    def grab(self):
+        ret = self._next_capture().grab()
+        self.current += 1
+        return ret
+
+    def set(self, property, value):
+        if property == cv2.CAP_PROP_POS_FRAMES:
+            n = int(value)
+            self.file_num = min(int(np.searchsorted(self.starts, n, side='right')) - 1, len(self.filenames) - 1)
+            self.current = n
+            return self._capture(self.file_num).set(property, n - self.starts[self.file_num])
+        self._properties[property] = value
+        return all([cap.set(property, value) for cap in self._captures.values()])
+
+    def get(self, property):
+        if property == cv2.CAP_PROP_POS_FRAMES:
+            return self.current
+        elif property == cv2.CAP_PROP_FRAME_COUNT:
+            return self.num_frames
+        return self._capture(self.file_num).get(property)
+
+    def release(self):
+        for cap in self._captures.values():
+            cap.release()
+        self._captures.clear()
+
+
+def _probe_img_files(files, check_all=False):
+    """Returns the metadata of a list of image files read from their headers, or
+    None if the first header can't be read. Results are cached per sequence.
+    Unless check_all, only the first file is read and uniform_size is None"""
+    if len(files) == 0:
+        return None
+    key = (files[0], len(files), os.path.getmtime(files[0]), check_all)
+    if key in _IMG_SEQ_METADATA:
+        return _IMG_SEQ_METADATA[key]
+
+    header = read_img_header(files[0])
+    if header is None:
+        return None
+    metadata = dict(header, num_files=len(files), uniform_size=None, mismatched_files=[])
+    if check_all:
+        size = (header['width'], header['height'])
+        for filename in files[1:]:
+            other = read_img_header(filename)
+            if (other is None) or ((other['width'], other['height']) != size):
+                metadata['mismatched_files'].append(filename)
+        metadata['uniform_size'] = len(metadata['mismatched_files']) == 0
+        if not metadata['uniform_size']:
+            print('Warning: {} files in sequence are not the same size as {}'.format(
+                len(metadata['mismatched_files']), files[0]))
+    _IMG_SEQ_METADATA[key] = metadata
+    return metadata
+
+
+def probe_img_seq(file_filter, check_all=False):
+    """
+    Function to get the metadata of an img sequence without decoding any images
+
+    file_filter :   full path including wild cards to specify images
+    check_all   :   if True read every file's header to check they are all the same size
+
+    returns dict with width, height, channels and bit_depth of the first file, num_files,
+    uniform_size (None unless check_all) and mismatched_files, the files whose size differs.
+    Returns None if the first file's header can't be read.
+    """
+    files = BatchProcess(file_filter, smart_sort=smart_number_sort)
+    return _probe_img_files(files.files, check_all=check_all)
+
+
+class _SeekIndex:
+    """Keyframe and presentation timestamp index of a video file.
+
+    The index is built in a single demux pass (packets are not decoded) and is
+    saved as a sidecar file next to the video (video filename + '.index.npz')
+    so it only has to be built once. If the backend can't demux without
+    decoding, every frame is treated as a keyframe which falls back to the
+    normal OpenCV seek.
+
+    Attributes
+    ----------
+    keyframes : np.ndarray
+        sorted frame numbers of the keyframes
+    pts : np.ndarray
+        presentation timestamp of each frame in ms
+    num_frames : int
+        exact number of frames in the video
+    """
+
+    def __init__(self, keyframes, pts):
+        self.keyframes = np.asarray(keyframes, dtype=np.int64)
+        self.pts = np.asarray(pts, dtype=np.float64)
+        self.num_frames = len(self.pts)
+
+    @staticmethod
+    def sidecar_filename(filename: str):
+        return filename + '.index.npz'
+
+    @classmethod
+    def build(cls, filename: str):
+        """Demux the whole video once recording keyframes and timestamps. Packets are
+        demuxed in decode order, which differs from display order with B-frames, so
+        they are sorted by timestamp and keyframes numbered by their display position"""
+        cap = cv2.VideoCapture(filename)
+        raw = cap.set(cv2.CAP_PROP_FORMAT, -1)
+        keyframes = []
+        pts = []
+        while cap.grab():
+            if (not raw) or cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                keyframes.append(len(pts))
+            pts.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+        cap.release()
+        display_order = np.argsort(pts, kind='stable')
+        display_position = np.empty(len(pts), dtype=np.int64)
+        display_position[display_order] = np.arange(len(pts))
+        return cls(np.sort(display_position[keyframes]), np.asarray(pts)[display_order])
+
+    @classmethod
+    def load(cls, filename: str):
+        """Loads the sidecar index of a video, returns None if there isn't an
+        up to date one"""
+        index_filename = cls.sidecar_filename(filename)
+        if not os.path.exists(index_filename):
+            return None
+        stat = os.stat(filename)
+        with np.load(index_filename) as data:
+            if (data['size'] != stat.st_size) or (data['mtime'] != stat.st_mtime):
+                return None
+            return cls(data['keyframes'], data['pts'])
+
+    @classmethod
+    def load_or_build(cls, filename: str):
+        """If the sidecar can't be saved, eg the video is on read only storage,
+        the index is only kept in memory"""
+        index = cls.load(filename)
+        if index is None:
+            index = cls.build(filename)
+            try:
+                index.save(filename)
+            except OSError:
+                pass
+        return index
+
+    def save(self, filename: str):
+        stat = os.stat(filename)
+        np.savez(self.sidecar_filename(filename), keyframes=self.keyframes, pts=self.pts,
+                 size=stat.st_size, mtime=stat.st_mtime)
+
+    @classmethod
+    def concatenate(cls, indexes):
+        """Combines the indexes of consecutive videos into one, numbering frames
+        globally and continuing the timestamps from one video to the next"""
+        keyframes = []
+        pts = []
+        frame_offset = 0
+        time_offset = 0.0
+        for index in indexes:
+            keyframes.append(index.keyframes + frame_offset)
+            pts.append(index.pts + time_offset)
+            frame_offset += index.num_frames
+            if index.num_frames > 1:
+                time_offset += index.pts[-1] + np.median(np.diff(index.pts))
+        return cls(np.concatenate(keyframes), np.concatenate(pts))
+
+    def keyframe_before(self, n: int):
+        """Returns the last keyframe at or before frame n"""
+        return int(self.keyframes[np.searchsorted(self.keyframes, n, side='right') - 1])
+
+
+class _ActivityIndex:
+    """Per frame activity scores used to skip the static parts of a recording.
+
+    The score of frame n is the mean absolute difference between frames n-1 and
+    n after they have been decoded to grayscale and downscaled, so computing it is
+    cheap. Frame 0 scores 0. For single files the scores are saved as a sidecar
+    file next to the video (filename + '.activity.npz') so they are only computed once.
+
+    Attributes
+    ----------
+    scores : np.ndarray
+        activity score of each frame in grey levels
+    downscale : int
+        downscale factor the frames were compared at
+    """
+
+    def __init__(self, scores, downscale: int):
+        self.scores = np.asarray(scores, dtype=np.float64)
+        self.downscale = int(downscale)
+
+    @staticmethod
+    def sidecar_filename(filename: str):
+        return filename + '.activity.npz'
+
+    @classmethod
+    def build(cls, filename, downscale: int = 8):
+        """Decode every frame once comparing each with the previous one. This stops at the
+        first frame that can't be read, eg past the real end of a video, so there is a
+        score for every frame read"""
+        scores = []
+        previous = None
+        with ReadVideo(filename, grayscale=True, fast_grayscale=True, downscale=downscale) as readvid:
+            for img in readvid:
+                if img is None:
+                    break
+                scores.append(0.0 if previous is None else cv2.absdiff(img, previous).mean())
+                previous = img
+        return cls(scores, downscale)
+
+    @classmethod
+    def load(cls, filename: str, downscale: int = 8):
+        """Loads the sidecar scores of a file, returns None if there aren't up
+        to date ones computed at this downscale"""
+        activity_filename = cls.sidecar_filename(filename)
+        if not os.path.exists(activity_filename):
+            return None
+        stat = os.stat(filename)
+        with np.load(activity_filename) as data:
+            if (data['size'] != stat.st_size) or (data['mtime'] != stat.st_mtime) or (
+                    data['downscale'] != downscale):
+                return None
+            return cls(data['scores'], downscale)
+
+    @classmethod
+    def load_or_build(cls, filename, downscale: int = 8):
+        """Lists of files and img sequences are built every time as there is no single file to save next to.
+        If the sidecar can't be saved, eg the file is on read only storage, the scores are only kept in memory"""
+        single_file = isinstance(filename, str) and os.path.isfile(filename)
+        index = cls.load(filename, downscale) if single_file else None
+        if index is None:
+            index = cls.build(filename, downscale)
+            if single_file:
+                try:
+                    index.save(filename)
+                except OSError:
+                    pass
+        return index
+
+    def save(self, filename: str):
+        stat = os.stat(filename)
+        np.savez(self.sidecar_filename(filename), scores=self.scores, downscale=self.downscale,
+                 size=stat.st_size, mtime=stat.st_mtime)
+
+    def default_threshold(self):
+        """Noise level of the scores, the median plus 3 robust standard deviations.
+        This assumes most of the recording is static."""
+        median = np.median(self.scores)
+        return median + 3*1.4826*np.median(np.abs(self.scores - median))
+
+    def active_ranges(self, threshold: Optional[float] = None, pad: int = 0):
+        """Returns a list of (start, stop) frame ranges containing every frame scoring
+        above threshold, extended by pad frames either side. Overlapping ranges are joined."""
+        threshold = self.default_threshold() if threshold is None else threshold
+        active = np.flatnonzero(self.scores > threshold)
+        if len(active) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(active) > 2*pad + 1)
+        starts = active[np.concatenate(([0], breaks + 1))] - pad
+        stops = active[np.concatenate((breaks, [len(active) - 1]))] + pad + 1
+        return [(int(max(start, 0)), int(min(stop, len(self.scores)))) for start, stop in zip(starts, stops)]
+
+
+class _FrameCache:
+    """Least recently used cache of decoded frames keyed by frame number.
+
+    The cache holds frames until their total size exceeds max_bytes, then the
+    least recently used frames are evicted. max_bytes=0 disables the cache.
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = int(max_bytes)
+        self.frames = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, n):
+        return n in self.frames
+
+    def get(self, n):
+        """Returns frame n and marks it as most recently used"""
+        self.frames.move_to_end(n)
+        self.hits += 1
+        return self.frames[n]
+
+    def put(self, n, im):
+        """Adds a freshly decoded frame, evicting old frames to stay within max_bytes"""
+        if im is None or im.nbytes > self.max_bytes:
+            return
+        self.misses += 1
+        if n in self.frames:
+            self.nbytes -= self.frames.pop(n).nbytes
+        self.frames[n] = im
+        self.nbytes += im.nbytes
+        while self.nbytes > self.max_bytes:
+            _, old_im = self.frames.popitem(last=False)
+            self.nbytes -= old_im.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        self.frames.clear()
+        self.nbytes = 0
+
+    @property
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'frames': len(self.frames),
+                'nbytes': self.nbytes,
+                'max_bytes': self.max_bytes}
+
+
 @Slicerator.from_class
 class ReadVideo:
     """Reading Videos or image sequences class
@@ -92,17 +629,36 @@ class ReadVideo:
     work with. It also works on a sequence of images through
     combination of BatchProcess from the filehandling repo and cv2.imread. User can use both with same interface.
 
+    When moving forward to a frame which isn't next, eg stepping through frame_range
+    or calling set_frame, the reader either grabs the frames in between, which
+    demuxes them without retrieving them, or seeks. It picks whichever is expected
+    to be cheaper from the distance, the GOP size and the seek and grab times
+    measured so far (see stats). Until they have been measured a seek is assumed
+    to cost the same as grabbing a GOP.
 
     Attributes
     ----------
     vid : instance
-        OpenCV VideoCapture instance or _ReadImgSeq instance depending on filetype
-    filename : str
-        Full path and filename to video or seq to read. If imgs supplying absolute path reads single img. Supplying path with wildcards ? * etc allows for pattern matching and selecting range of imgs.
+        OpenCV VideoCapture instance, _ReadImgSeq, _ReadRawFrames or _ReadArchive instance depending on filetype
+    filename : str or list
+        Full path and filename to video or seq to read. A list of videos, or a path with wildcards and a video
+        extension which isn't itself the name of a file, is read as a single continuous video with frames numbered across the files.
+        Each file is demuxed once when opened to count its frames exactly, unless index=True which does this anyway. A .npy file of stacked frames, see video_to_npy, is memory mapped.
+        A .lva file is a compressed frame archive written by ArchiveWriter. If imgs supplying absolute path reads single img. Supplying path with wildcards ? * etc allows for pattern matching and selecting range of imgs.
     grayscale : bool
-        True to read as grayscale
+        True to read as grayscale. img sequences are decoded straight to grayscale.
+    fast_grayscale : bool
+        videos only. If True and grayscale, frames are taken from the luma plane of
+        the decoder, skipping the conversion to BGR and back. Luma is expanded from
+        studio range so values are within a few grey levels of converting the BGR
+        frame, not identical. This is only used for 8 bit 4:2:0 (I420 or NV12) streams
+        decoded by FFmpeg which aren't jpeg based, as those are full range. Otherwise,
+        or if False (default), the BGR frame is converted exactly. The luma plane is read
+        through an undocumented OpenCV fallback whose per frame warning is silenced, see _read_vid.
     frame_range : tuple
-        (start frame num, end frame num, step) - in an img sequence frame_num is defined as position in the sequence of read files
+        (start frame num, end frame num, step) - in an img sequence frame_num is defined as position in the sequence of read files.
+        A negative step reads backwards, eg (None, None, -1) reads every frame from the last to the first. Videos
+        are then decoded forward a GOP at a time and returned in reverse, rather than seeking for every frame.
     frame_num : int
         current frame pointed at in video or seq
     num_frames : int
@@ -114,13 +670,59 @@ class ReadVideo:
     colour : int
         number of colour channels
     frame_size : tuple
-        gives same format as np.shape
+        gives same format as np.shape. width, height and frame_size describe the
+        source, not the frames returned when downscale > 1.
     fps : int
         number of frames per second - not defined for seq
     file_extension : str
         file extension of the video. ReadVideo works with .mp4, .MP4, .m4v and '.avi' and seqs with .png, .jpg, .tiff
     properties: dict
         a dictionary of the parameters
+    prefetch : int
+        if > 0 a background thread decodes up to this many upcoming frames
+        of frame_range into a queue so that decoding overlaps with whatever
+        is done with each frame. 0 (default) reads synchronously. Not used when
+        reading a video backwards.
+    index : bool
+        videos only. If True a keyframe index is loaded from, or built and saved to,
+        a sidecar file (filename + '.index.npz'). Seeks then go to the nearest
+        keyframe and decode forward which is faster and frame accurate, and
+        num_frames is exact rather than the container's estimate.
+    seek_index : _SeekIndex or None
+        the keyframe index if index=True
+    timestamps : np.ndarray
+        time of every frame in seconds, computed on first use and cached. For videos
+        these are the container's presentation timestamps, which are exact for variable
+        frame rate footage, from the seek index. If index=False it is loaded from an existing
+        sidecar file or built in memory, without saving one. For img sequences
+        see _ReadImgSeq.timestamps. Other files assume a constant fps.
+    cache_bytes : int
+        memory budget in bytes for an LRU cache of decoded frames. Revisiting a
+        cached frame needs no seek or decode. 0 (default) only caches the last frame.
+    frame_cache : _FrameCache
+        the LRU cache. frame_cache.stats gives hits, misses and evictions.
+    downscale : int
+        1 (default), 2, 4 or 8. Frames are returned with width and height reduced by
+        this factor. img sequences use OpenCV's reduced decode, video frames are area
+        downsampled straight after decoding.
+    roi : tuple or None
+        ((x1, y1), (x2, y2)) region of the source frame to return, as used by
+        images.crop. Frames are cropped straight after decoding, before downscaling,
+        grayscale conversion, return_function and copying, so only the roi is ever
+        copied or cached. None (default) returns the whole frame.
+    stats : dict
+        counters and timings of the work done reading so far: decode, seek, grab,
+        scale (cropping, downscaling and luma conversion straight after decoding),
+        grayscale, return_function and prefetch_wait timings, last_frame_hits and
+        the frame_cache stats. Each timing gives count, total, mean, min, max in seconds
+        and a histogram. stats_callback(name, seconds), if supplied, is called for every timing.
+    workers : int
+        img sequences only. Number of threads decoding upcoming files in parallel,
+        0 (default) decodes each file when it is read.
+    copy : bool
+        If True (default) every frame returned is a fresh copy. If False the
+        returned array may be shared with the internal caches so it must not be
+        modified in place. Use read_frame_into to avoid allocating at all.
 
     Examples
     --------
@@ -134,6 +736,39 @@ class ReadVideo:
         | for img in ReadVideo(filename, range=(5,20,4)):
         |     labvision.images.basics.display(img)
 
+    Decode the next frames in the background while processing:
+
+        | for img in ReadVideo(filename, prefetch=8):
+        |     DoStuff(img)
+
+    Reuse one preallocated array for every frame:
+
+        | img = np.empty(readvid.frame_size, dtype=np.uint8)
+        | for n in range(readvid.num_frames):
+        |     readvid.read_frame_into(img)
+
+    Read a random sample of frames, in ascending order but returned in the order asked for:
+
+        | frames = readvid[[5, 900, 12, 13, 14, 4000]]
+
+    Read a stack of frames into a single array:
+
+        | stack = readvid.read_batch(frames=readvid[10:20])
+
+    Split the frames across processes, results are returned in frame order:
+
+        | means = ReadVideo(filename).parallel_map(np.mean, workers=8)
+
+    Analyse only the frames where something changes:
+
+        | for n, img in ReadVideo(filename).iter_active(pad=5):
+        |     DoStuff(img)
+
+    Iterate without blocking an asyncio event loop, frames are decoded in a dedicated thread:
+
+        | async for img in ReadVideo(filename):
+        |     await DoStuff(img)
+
     ReadVideo supports "with" usage. This basically means no need to call .close():
 
         | with ReadVideo() as readvid:
@@ -141,48 +776,125 @@ class ReadVideo:
 
     """
 
-    def __init__(self, filename: Optional[str] = None, grayscale: bool = False,
-                 frame_range: FrameRange = (0, None, 1), return_function=None):
+    def __init__(self, filename: Optional[Union[str, List[str]]] = None, grayscale: bool = False,
+                 frame_range: FrameRange = (0, None, 1), return_function=None,
+                 prefetch: int = 0, index: bool = False, cache_bytes: int = 0,
+                 copy: bool = True, workers: int = 0, fast_grayscale: bool = False,
+                 downscale: int = 1, roi=None, stats_callback=None):
+        assert downscale in _IMREAD_FLAGS, 'downscale must be 1, 2, 4 or 8'
         self.filename = filename
+        self._stats = Stats(stats_callback)
+        self.downscale = downscale
+        self.roi = roi
+        self._full_frame = None
         self.grayscale = grayscale
+        self.fast_grayscale = fast_grayscale
+        self.workers = workers
         self._detect_file_type()
+        self.seek_index = None
+        self._file_seek_indexes = None
+        self._timestamps = None
+        self._activity_index = None
+        if index and self.filetype == 'video':
+            self._file_seek_indexes = [_SeekIndex.load_or_build(filename) for filename in self.filenames]
+            self.seek_index = _SeekIndex.concatenate(self._file_seek_indexes)
         self.init_video()
         self.get_vid_props()
+        self._roi_slices = None if roi is None else self._calc_roi_slices()
         self.frame_num: int = 0
         self.vid_position = 0
         self.cached_frame = None
         self.cached_frame_number = None
+        self.frame_cache = _FrameCache(cache_bytes)
+        self.copy = copy
+        self._buffer = None
+        self.prefetch = int(prefetch)
+        self._prefetcher = None
+        self._backwards_block = {}
         self.set_frame_range(frame_range)
         self.return_func = return_function
 
     def set_frame_range(self, frame_range: FrameRange):
         """set_frame_range limits the accessible frames in the video and the 
-        frames iterated over. frame_range is a tuple (start_index, finish_index, step size)"""
-        self.frame_range = (frame_range[0], self.num_frames, frame_range[2]) if (
-            frame_range[1] == None) else frame_range
-        self.frame_num = int(frame_range[0])
+        frames iterated over. frame_range is a tuple (start_index, finish_index, step size).
+        If step is negative start defaults to the last frame and finish to before the first"""
+        self._stop_prefetch()
+        self._backwards_block = {}
+        start, stop, step = frame_range
+        if start is None:
+            start = 0 if step > 0 else self.num_frames - 1
+        if stop is None:
+            stop = self.num_frames if step > 0 else -1
+        self.frame_range = (start, stop, step)
+        self.frame_num = int(start)
         if self.frame_num != self.vid_position:
             self.set_frame(self.frame_num)
 
+    def _reading_backwards(self):
+        """private method, True if frame_range steps backwards through a video"""
+        return (self.frame_range[2] < 0) and (self.filetype == 'video')
+
+    def _estimate_gop_size(self):
+        """private method returning the typical number of frames between keyframes"""
+        if (self.seek_index is not None) and (len(self.seek_index.keyframes) > 1):
+            return int(np.median(np.diff(self.seek_index.keyframes)))
+        return DEFAULT_GOP_SIZE
+
     def _detect_file_type(self):
         """establishes the type of file based on file extension
         this is used to select either video or img_seq internally
         """
-        self.ext = os.path.splitext(self.filename)[1]
+        if isinstance(self.filename, (list, tuple)):
+            self.filenames = list(self.filename)
+        elif any(wildcard in self.filename for wildcard in '*?[') and \
+                (os.path.splitext(self.filename)[1] in VID_FILE_EXT) and not os.path.exists(self.filename):
+            self.filenames = BatchProcess(self.filename, smart_sort=smart_number_sort).files
+            assert len(self.filenames) > 0, 'No videos match filename'
+        else:
+            self.filenames = [self.filename]
+        self.ext = os.path.splitext(self.filenames[0])[1]
 
         if self.ext in VID_FILE_EXT:
             self.filetype = 'video'
         elif self.ext in IMG_FILE_EXT:
             self.filetype = 'img_seq'
+        elif self.ext in RAW_FILE_EXT:
+            self.filetype = 'raw'
+        elif self.ext in ARCHIVE_FILE_EXT:
+            self.filetype = 'archive'
         else:
             raise NotImplementedError('File extension is not implemented')
 
     def init_video(self):
         """ Initialise video capture object or img_sequence"""
+        self._luma = False
         if self.filetype == 'video':
-            self.vid = cv2.VideoCapture(self.filename)
+            if len(self.filenames) > 1:
+                self.vid = _ReadConcatVideo(self.filenames, seek_indexes=self._file_seek_indexes)
+            else:
+                self.vid = cv2.VideoCapture(self.filenames[0])
+            if self.grayscale and self.fast_grayscale and self._luma_supported():
+                self._luma = self.vid.set(cv2.CAP_PROP_CONVERT_RGB, 0) and \
+                    (self.vid.get(cv2.CAP_PROP_CONVERT_RGB) == 0)
         elif self.filetype == 'img_seq':
-            self.vid = _ReadImgSeq(self.filename)
+            self.vid = _ReadImgSeq(self.filename, workers=self.workers,
+                                   grayscale=self.grayscale, downscale=self.downscale)
+        elif self.filetype == 'raw':
+            self.vid = _ReadRawFrames(self.filename)
+        elif self.filetype == 'archive':
+            self.vid = _ReadArchive(self.filename)
+
+    def _luma_supported(self):
+        """private method, True if every video file is an 8 bit, studio range, 4:2:0
+        stream decoded by FFmpeg so the luma plane can be used for grayscale"""
+        if len(self.filenames) == 1:
+            return _capture_has_luma(self.vid)
+        supported = True
+        for filename in self.filenames:
+            cap = cv2.VideoCapture(filename)
+            supported = supported and _capture_has_luma(cap)
+            cap.release()
+        return supported
 
     def get_vid_props(self):
         """
@@ -191,20 +903,24 @@ class ReadVideo:
         :return: dict(properties)
         """
         self.frame_num = int(self.vid.get(cv2.CAP_PROP_POS_FRAMES))
-        self.num_frames = int(self.vid.get(cv2.CAP_PROP_FRAME_COUNT))
+        if self.seek_index is None:
+            self.num_frames = int(self.vid.get(cv2.CAP_PROP_FRAME_COUNT))
+        else:
+            self.num_frames = self.seek_index.num_frames
         self.current_time = self.vid.get(cv2.CAP_PROP_POS_MSEC)
         self.width = int(self.vid.get(cv2.CAP_PROP_FRAME_WIDTH))
         self.height = int(self.vid.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        if self.vid.get(cv2.CAP_PROP_MONOCHROME) == 0.0:
+        # MONOCHROME is -1 if the backend doesn't report it, eg FFmpeg in OpenCV 5, which decodes to BGR
+        if self.vid.get(cv2.CAP_PROP_MONOCHROME) in (0.0, -1.0):
             self.colour = 3
             self.frame_size = (self.height, self.width, 3)
         else:
             self.colour = 1
-            self.frame_size = (self.width, self.height)
+            self.frame_size = (self.height, self.width)
         self.fps = self.vid.get(cv2.CAP_PROP_FPS)
         self.format = self.vid.get(cv2.CAP_PROP_FORMAT)
         self.codec = self.vid.get(cv2.CAP_PROP_FOURCC)
-        self.file_extension = self.filename.split('.')[1]
+        self.file_extension = self.ext[1:]
 
         self.properties = {'frame_num': self.frame_num,
                            'num_frames': self.num_frames,
@@ -243,19 +959,168 @@ class ReadVideo:
             index specifying the frame
         :return: None
         """
-        if n == self.cached_frame_number:
+        if (n == self.cached_frame_number) or (n in self.frame_cache) or (n in self._backwards_block):
             self.frame_num = n
-        elif n == self.vid_position:
+            return
+
+        if self._prefetcher is not None:
+            if n == self._prefetcher.next_frame:
+                self.frame_num = n
+                return
+            self._stop_prefetch()
+
+        if n == self.vid_position:
             self.frame_num = n
         else:
+            frames = range(*self.frame_range)
             self.frame_num = n
-            if self.frame_num < self.frame_range[0]:
-                self.frame_num = self.frame_range[0]
-            elif self.frame_num >= self.frame_range[1]:
-                self.frame_num = self.frame_range[1] - 1
-            if self.frame_num != self.vid_position:
-                self.vid.set(cv2.CAP_PROP_POS_FRAMES, float(n))
-                self.vid_position = n
+            if frames:
+                first, last = min(frames[0], frames[-1]), max(frames[0], frames[-1])
+                self.frame_num = min(max(n, first), last)
+            # reading backwards positions the reader itself, see _read_backwards
+            if (self.frame_num != self.vid_position) and not self._reading_backwards():
+                self._skip_to(self.frame_num)
+
+    def _seek(self, n):
+        """private method that moves the underlying reader so the next
+        decoded frame is n. With a seek_index this seeks to the keyframe at or
+        before n, unless already decoding within that GOP, and decodes forward"""
+        if self.seek_index is None:
+            start = perf_counter()
+            self.vid.set(cv2.CAP_PROP_POS_FRAMES, float(n))
+            self._stats.add_time('seek', perf_counter() - start)
+            self.vid_position = n
+        else:
+            keyframe = self.seek_index.keyframe_before(n)
+            if not keyframe <= self.vid_position <= n:
+                start = perf_counter()
+                self.vid.set(cv2.CAP_PROP_POS_FRAMES, float(keyframe))
+                self._stats.add_time('seek', perf_counter() - start)
+                self.vid_position = keyframe
+            self._grab_forward(n)
+
+    @property
+    def timestamps(self):
+        if self._timestamps is None:
+            if self.filetype == 'video':
+                seek_index = self.seek_index
+                if (seek_index is None) and isinstance(self.vid, _ReadConcatVideo):
+                    seek_index = _SeekIndex.concatenate(self.vid.seek_indexes)
+                elif seek_index is None:
+                    # without index=True an existing sidecar is used but a new one isn't saved
+                    seek_index = _SeekIndex.load(self.filenames[0]) or _SeekIndex.build(self.filenames[0])
+                self._timestamps = seek_index.pts / 1000
+            elif self.filetype == 'img_seq':
+                self._timestamps = self.vid.timestamps()
+            else:
+                assert self.fps > 0, 'frame rate unknown so no timestamps'
+                self._timestamps = np.arange(self.num_frames) / self.fps
+        return self._timestamps
+
+    def frame_at_time(self, t: float):
+        """Returns the index of the frame being displayed at time t in seconds,
+        ie the last frame whose timestamp is <= t"""
+        return max(int(np.searchsorted(self.timestamps, t, side='right')) - 1, 0)
+
+    def read_time(self, t: float):
+        """
+        | Read the frame being displayed at time t
+        |
+        | :param t: float
+        |    time in seconds on the same clock as timestamps
+        | :return: np.ndarray
+        |    returns the image
+        """
+        return self.read_frame(n=self.frame_at_time(t))
+
+    def activity(self, downscale: int = 8):
+        """
+        | Per frame activity scores of the whole file, the mean absolute difference in grey
+        | levels from the previous frame. Computed on first use and cached in a sidecar file.
+        |
+        | :param downscale: int
+        |    frames are compared after downscaling by 2, 4 or 8
+        | :return: np.ndarray
+        |    score of every frame
+        """
+        if (self._activity_index is None) or (self._activity_index.downscale != downscale):
+            self._activity_index = _ActivityIndex.load_or_build(self.filename, downscale)
+        return self._activity_index.scores
+
+    def active_ranges(self, threshold: Optional[float] = None, pad: int = 0, downscale: int = 8):
+        """
+        | Frame ranges where something changes
+        |
+        | :param threshold: float
+        |    frames scoring above this are active. If None the noise level of the scores is used
+        | :param pad: int
+        |    number of frames either side of active frames also included
+        | :return: list
+        |    (start, stop) of each active range
+        """
+        self.activity(downscale)
+        return self._activity_index.active_ranges(threshold, pad)
+
+    def iter_active(self, threshold: Optional[float] = None, pad: int = 0, downscale: int = 8):
+        """
+        | Iterate over only the frames of frame_range which are in active_ranges.
+        | Static stretches are skipped without being decoded.
+        |
+        | :return: generator
+        |    yields (frame number, image)
+        """
+        ranges = self.active_ranges(threshold, pad, downscale)
+        active = np.zeros(len(self._activity_index.scores), dtype=bool)
+        for start, stop in ranges:
+            active[start:stop] = True
+        for n in range(*self.frame_range):
+            if (n < len(active)) and active[n]:
+                yield n, self.read_frame(n)
+
+    def _skip_to(self, n):
+        """private method that moves the reader to n, grabbing forward if that
+        is expected to be cheaper than seeking"""
+        if self._grab_is_cheaper(n):
+            self._grab_forward(n)
+        else:
+            self._seek(n)
+
+    def _grab_is_cheaper(self, n):
+        """private method comparing the expected cost of grabbing forward to n with
+        seeking. With a seek_index a seek also has to grab from the keyframe to n."""
+        distance = n - self.vid_position
+        if (distance <= 0) or (self.filetype != 'video'):
+            return False
+        seek_cost, grab_cost = self._seek_and_grab_costs()
+        if self.seek_index is not None:
+            keyframe = self.seek_index.keyframe_before(n)
+            if keyframe <= self.vid_position:
+                return True
+            seek_cost += (n - keyframe)*grab_cost
+        return distance*grab_cost <= seek_cost
+
+    def _seek_and_grab_costs(self):
+        """private method returning the mean cost of a seek and of grabbing one frame,
+        measured if there are enough samples otherwise in units of one grab"""
+        seek = self._stats.timings.get('seek')
+        grab = self._stats.timings.get('grab')
+        grabbed_frames = self._stats.counters.get('grabbed_frames', 0)
+        if (seek is not None) and (grab is not None) and (seek.count >= MIN_COST_SAMPLES) and (
+                grabbed_frames >= MIN_COST_SAMPLES):
+            return seek.total / seek.count, grab.total / grabbed_frames
+        return float(self._estimate_gop_size()), 1.0
+
+    def _grab_forward(self, n):
+        """private method that advances the underlying reader to n without
+        retrieving the frames in between"""
+        if self.vid_position >= n:
+            return
+        start = perf_counter()
+        self._stats.count('grabbed_frames', n - self.vid_position)
+        while self.vid_position < n:
+            self.vid.grab()
+            self.vid_position += 1
+        self._stats.add_time('grab', perf_counter() - start)
 
     def read_next_frame(self):
         """
@@ -266,48 +1131,371 @@ class ReadVideo:
 
         :return:
         """
-        assert (self.frame_num >= self.frame_range[0]) & \
-               (self.frame_num < self.frame_range[1]) & \
-               ((self.frame_num - self.frame_range[0]) % self.frame_range[
-                   2] == 0), \
-            'Frame not in range'
+        ret, im = self._next_raw_frame()
+        if ret:
+            im = self._process(im)
+            return im.copy() if self.copy else im
+
+    def read_frame_into(self, out, n=None):
+        """
+        | Read a frame into a preallocated array. Where possible the frame is
+        | decoded straight into out so a loop reading frames allocates nothing.
+        |
+        | :param out: np.ndarray
+        |    array with the shape and dtype of the frames being returned
+        | :param n: int
+        |    frame index. If None or not specified reads the next available frame.
+        | :return: np.ndarray
+        |    out, filled with the frame
+        """
+        if n is not None:
+            assert n in range(self.frame_range[0], self.frame_range[1],
+                              self.frame_range[2]), 'requested frame not in frame_range'
+            self.set_frame(n)
+        ret, im = self._next_raw_frame(image=self._decode_target(out))
+        if ret:
+            im = self._process(im, out=out)
+            if im is not out:
+                np.copyto(out, im)
+            return out
+
+    def read_batch(self, n=None, frames=None, out=None):
+        """
+        | Read several frames into one contiguous array of shape (N, H, W) or (N, H, W, C)
+        |
+        | :param n: int
+        |    number of frames to read continuing from the current frame_num in steps
+        |    of frame_range. If None and frames is None reads to the end of frame_range.
+        | :param frames: slice, iterable of ints or a slice of this ReadVideo eg readvid[2:8]
+        |    frame indices to read instead of continuing from frame_num. They are read
+        |    in ascending order, as in read_frames, but stored in the order given.
+        | :param out: np.ndarray
+        |    optional array, at least N long, which is reused rather than allocating a new one
+        | :return: np.ndarray
+        |    the frames stacked along the first axis. Reading stops at the first frame
+        |    that can't be read, eg past the real end of a video, and only the frames
+        |    before it in the order given are returned, so this may be shorter than N or
+        |    have length 0.
+        """
+        if frames is None:
+            frames = range(self.frame_num, self.frame_range[1], self.frame_range[2])[:n]
+            sequential = True
+        else:
+            if isinstance(frames, slice):
+                frames = range(*frames.indices(self.num_frames))
+            elif isinstance(frames, Slicerator):
+                frames = frames.indices
+            frames = list(frames)
+            sequential = False
+
+        order = range(len(frames)) if sequential else self._read_order(frames)
+        read = np.zeros(len(frames), dtype=bool)
+        for i in order:
+            frame = None if sequential else frames[i]
+            if out is None:
+                im = self.read_frame(n=frame)
+                if im is None:
+                    break
+                out = np.empty((len(frames),) + np.shape(im), dtype=im.dtype)
+                out[i] = im
+            elif self.read_frame_into(out[i], n=frame) is None:
+                break
+            read[i] = True
+
+        if out is None:
+            return self._empty_batch()
+        num_read = len(frames) if read.all() else int(np.argmin(read))
+        return out[:num_read]
+
+    def _empty_batch(self):
+        """private method returning a batch of no frames. Its shape is that of the frames
+        after cropping, downscaling and grayscale conversion, but not return_function"""
+        shape = self._decoded_size()
+        if self.filetype == 'raw':
+            dtype = self.vid.frames.dtype
+        elif self.filetype == 'archive':
+            dtype = self.vid.dtype
+        else:
+            dtype = np.uint8
+        if self.grayscale:
+            return np.empty((0,) + shape, dtype=dtype)
+        channels = tuple(self.vid.frame_size[2:]) if self.filetype in ('raw', 'archive') else (3,)
+        return np.empty((0,) + shape + channels, dtype=dtype)
+
+    def read_frames(self, indices):
+        """
+        | Read frames in any order, eg a random sample
+        |
+        | The frames are read in ascending order, so nearby frames are decoded
+        | sequentially and each GOP is decoded at most once, and returned in the
+        | order requested. Indexing with a list or array, eg readvid[[5, 900, 12]], calls this.
+        |
+        | :param indices: iterable of int
+        |    frame indices, which may be unsorted or repeated
+        | :return: list
+        |    np.ndarray of each frame in the order of indices
+        """
+        indices = [int(n) for n in indices]
+        frames = {}
+        for i in self._read_order(indices):
+            if indices[i] not in frames:
+                frames[indices[i]] = self.read_frame(n=indices[i])
+        result = []
+        returned = set()
+        for n in indices:
+            result.append(frames[n].copy() if (self.copy and n in returned) else frames[n])
+            returned.add(n)
+        return result
+
+    def _read_order(self, indices):
+        """private method returning the positions of indices in the order the frames
+        are cheapest to read, ascending or descending if reading backwards"""
+        return sorted(range(len(indices)), key=indices.__getitem__, reverse=self._reading_backwards())
+
+    def _decode_target(self, out):
+        """private method that picks the array read_frame_into can decode into.
+        Frames kept in the LRU cache need their own array so get None."""
+        if self.frame_cache.max_bytes or self.filetype != 'video':
+            return None
+        if not ((self.grayscale and not self._luma) or self.return_func):
+            return out
+        if self._buffer is None:
+            height, width = self._decoded_size()
+            shape = (height, width) if self._luma else (height, width, 3)
+            self._buffer = np.empty(shape, dtype=np.uint8)
+        return self._buffer
+
+    def _decoded_size(self):
+        """private method returning (height, width) of the frames after cropping and downscaling"""
+        if self.roi is None:
+            height, width = self.height, self.width
+        else:
+            (x1, y1), (x2, y2) = self.roi
+            height, width = y2 - y1, x2 - x1
+        return -(-height // self.downscale), -(-width // self.downscale)
+
+    def _calc_roi_slices(self):
+        """private method returning the slices which crop roi from a decoded frame.
+        img sequences are already downscaled by the decoder so the roi is scaled to match."""
+        (x1, y1), (x2, y2) = self.roi
+        assert (0 <= x1 < x2 <= self.width) and (0 <= y1 < y2 <= self.height), 'roi outside frame'
+        if self.filetype != 'img_seq':
+            return slice(y1, y2), slice(x1, x2)
+        height, width = self._decoded_size()
+        top, left = y1 // self.downscale, x1 // self.downscale
+        return slice(top, top + height), slice(left, left + width)
+
+    def _next_raw_frame(self, image=None):
+        """private method returning the decoded frame at frame_num before any
+        conversion, from the caches if possible, and advancing frame_num.
+        If the frame has to be decoded it is decoded into image if supplied"""
+        assert self.frame_num in range(*self.frame_range), 'Frame not in range'
 
         if self.frame_num == self.cached_frame_number:
             ret = True
             im = self.cached_frame
+            self._stats.count('last_frame_hits')
+        elif self.frame_num in self.frame_cache:
+            ret = True
+            im = self.frame_cache.get(self.frame_num)
+            self.cached_frame = im
+            self.cached_frame_number = self.frame_num
+        elif self._reading_backwards():
+            frames = range(*self.frame_range)
+            ret, im = self._read_backwards(self.frame_num, -frames.step, frames[-1])
+        elif self.prefetch:
+            ret, im = self._read_prefetched()
         elif self.frame_num == self.vid_position:
-            ret, im = self._read()
+            ret, im = self._read(image)
         else:
-            self.set_frame(self.frame_num)
-            ret, im = self._read()
+            self._skip_to(self.frame_num)
+            ret, im = self._read(image)
 
         self.frame_num += self.frame_range[2]
+        return ret, im
 
-        if ret:
-            if self.grayscale:
+    def _read_backwards(self, n, step, lowest):
+        """private method returning frame n of a video being read backwards, step frames
+        at a time, down to frame lowest. Rather than seeking for every frame, the frames
+        due from the keyframe before n (or a GOP before n without a seek_index) up to n
+        are decoded forward in one pass and kept, so the next frames come from the block."""
+        if n not in self._backwards_block:
+            self._backwards_block = {}
+            if self.seek_index is not None:
+                block_start = self.seek_index.keyframe_before(n)
+            else:
+                block_start = n - self._estimate_gop_size() + 1
+            for m in reversed(range(n, max(block_start, lowest) - 1, -step)):
+                if m != self.vid_position:
+                    self._skip_to(m)
+                ret, im = self._read()
+                if not ret:
+                    break
+                self._backwards_block[m] = im
+        im = self._backwards_block.pop(n, None)
+        return im is not None, im
+
+    def _read_forward(self, n):
+        """private method returning frame n of a video, from the caches if possible,
+        otherwise moving forward to it as when frame_range steps forwards"""
+        if n == self.cached_frame_number:
+            self._stats.count('last_frame_hits')
+            return True, self.cached_frame
+        if n in self.frame_cache:
+            return True, self.frame_cache.get(n)
+        if n != self.vid_position:
+            self._skip_to(n)
+        return self._read()
+
+    def _process(self, im, out=None):
+        """private method applying grayscale conversion and return_function"""
+        if self.grayscale:
+            start = perf_counter()
+            if (out is not None) and (not self.return_func) and (im.ndim == 3):
+                im = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY, dst=out)
+            else:
                 im = images.bgr_to_gray(im)
-            if self.return_func:
-                im = self.return_func(im)
-
-            return im.copy()
-
-    def _read(self):
+            self._stats.add_time('grayscale', perf_counter() - start)
+        if self.return_func:
+            start = perf_counter()
+            im = self.return_func(im)
+            self._stats.add_time('return_function', perf_counter() - start)
+        return im
+
+    def _read(self, image=None):
         """private method that reads next image. By caching the previous frame
-        this speeds up things in reading video"""
-        ret, im = self.vid.read()
-        self.cached_frame = im
+        this speeds up things in reading video. If image is supplied the frame
+        is decoded into it and, as the caller owns image, isn't cached"""
+        if image is not None:
+            self.cached_frame = None
+            self.cached_frame_number = None
+            return self._decode(image)
         self.cached_frame_number = self.vid_position
+        ret, im = self._decode()
+        self.cached_frame = im
+        if ret:
+            self.frame_cache.put(self.cached_frame_number, im)
+        return ret, im
+
+    def _decode(self, image=None):
+        """private method that decodes the frame at vid_position and advances it.
+        Video frames are decoded into a reused full size frame when they
+        are going to be cropped or downscaled"""
+        resize = (self.downscale > 1) and (self.filetype != 'img_seq')
+        reuse_full_frame = (resize or (self.roi is not None)) and (self.filetype == 'video')
+        start = perf_counter()
+        if reuse_full_frame:
+            ret, self._full_frame = self._read_vid(self._full_frame)
+            im = self._full_frame
+        else:
+            ret, im = self._read_vid(image)
+        decoded = perf_counter()
+        self._stats.add_time('decode', decoded - start)
         self.vid_position += 1
+        if ret and self._luma:
+            im = self._luma_plane(im)
+        if ret and (self.roi is not None):
+            im = im[self._roi_slices]
+            if reuse_full_frame and not resize:
+                # only the roi is copied out of the reused full frame
+                if image is None:
+                    im = im.copy()
+                else:
+                    np.copyto(image, im)
+                    im = image
+        if ret and resize:
+            height, width = self._decoded_size()
+            im = cv2.resize(im, (width, height), dst=image, interpolation=cv2.INTER_AREA)
+        if ret and self._luma:
+            im = cv2.LUT(im, _LUMA_TO_GRAY, dst=im)
+        if ret and (self._luma or reuse_full_frame or (self.roi is not None)):
+            self._stats.add_time('scale', perf_counter() - decoded)
+        return ret, im
+
+    def _read_vid(self, image=None):
+        """private method reading the next frame from vid, into image if supplied. The luma
+        path relies on OpenCV's undocumented fallback of returning a yuv frame it doesn't
+        recognise as a single 8 bit plane, which logs a warning for every frame, so OpenCV's
+        log level is raised to errors for the duration of the read. The log level is global
+        so warnings from other threads are also hidden during the read."""
+        if not self._luma:
+            return self.vid.read() if image is None else self.vid.read(image)
+        log_level = cv2.utils.logging.getLogLevel()
+        cv2.utils.logging.setLogLevel(cv2.utils.logging.LOG_LEVEL_ERROR)
+        try:
+            return self.vid.read() if image is None else self.vid.read(image)
+        finally:
+            cv2.utils.logging.setLogLevel(log_level)
+
+    def _luma_plane(self, im):
+        """private method returning the luma plane from the frame returned by the
+        decoder. If the backend still returned a BGR image the luma path is switched
+        off and the frame is left for the normal grayscale conversion."""
+        if im.ndim == 3:
+            self._luma = False
+            self.vid.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+            return im
+        return im[:self.height]
+
+    def _read_prefetched(self):
+        """private method that takes the frame at frame_num from the prefetch
+        queue, (re)starting the background thread if it isn't already
+        decoding from that frame"""
+        if self._prefetcher is None or self._prefetcher.next_frame != self.frame_num:
+            self._stop_prefetch()
+            self._prefetcher = _Prefetcher(self, self.frame_num, self.prefetch)
+        start = perf_counter()
+        n, ret, im = self._prefetcher.get()
+        self._stats.add_time('prefetch_wait', perf_counter() - start)
+        self.cached_frame = im
+        self.cached_frame_number = n
+        if ret:
+            self.frame_cache.put(n, im)
         return ret, im
 
+    def _stop_prefetch(self):
+        """Stops the prefetch thread and discards any frames it has queued"""
+        if self._prefetcher is not None:
+            self._prefetcher.stop()
+            self._prefetcher = None
+
+    def _reader_kwargs(self):
+        """The keyword arguments needed to open another ReadVideo on the same
+        source that returns identical frames"""
+        return {'grayscale': self.grayscale,
+                'fast_grayscale': self.fast_grayscale,
+                'downscale': self.downscale,
+                'roi': self.roi,
+                'return_function': self.return_func,
+                'index': self.seek_index is not None}
+
+    def parallel_map(self, func, workers: Optional[int] = None, chunk: Optional[int] = None):
+        """Apply func to every frame in frame_range using multiple processes.
+        See parallel_map in this module for details."""
+        return parallel_map(self.filename, func, workers=workers, chunk=chunk,
+                            frame_range=self.frame_range, **self._reader_kwargs())
+
+    @property
+    def stats(self):
+        stats = self._stats.summary
+        stats['frame_cache'] = self.frame_cache.stats
+        return stats
+
+    def reset_stats(self):
+        """Zeroes the stats counters and timings, not those of frame_cache"""
+        self._stats.reset()
+
     def clear_cache(self):
+        """Empties the last frame cache and the LRU frame cache"""
         self.cached_frame = None
         self.cached_frame_number = None
+        self._backwards_block = {}
+        self.frame_cache.clear()
 
     def close(self):
         """Closes video object"""
-        if self.filetype == 'video':
-            self.vid.release()
+        self._stop_prefetch()
+        self.vid.release()
 
     def __getitem__(self, frame_num):
         """Getter reads frame specified by passed index"""
@@ -324,11 +1512,76 @@ class ReadVideo:
         Generator returns next available frame specified by step
         :return:
         """
-        if self.frame_num < self.frame_range[1]:
+        if self.frame_num in range(*self.frame_range):
             return self.read_frame()
         else:
             raise StopIteration
 
+    def __reversed__(self):
+        """
+        Generator returning the frames of frame_range in reverse order. Videos are
+        decoded forward a GOP at a time which is returned in reverse, see _read_backwards,
+        unless frame_range steps backwards in which case the frames are read forward.
+        """
+        frames = range(*self.frame_range)
+        for n in reversed(frames):
+            if self.filetype != 'video':
+                im = self.read_frame(n)
+            else:
+                self._stop_prefetch()
+                if frames.step < 0:
+                    # reversing a backwards frame_range reads forward
+                    ret, im = self._read_forward(n)
+                else:
+                    ret, im = self._read_backwards(n, frames.step, frames[0])
+                if not ret:
+                    return
+                im = self._process(im)
+                im = im.copy() if self.copy else im
+            yield im
+
+    def __aiter__(self):
+        return self.aiter_frames()
+
+    async def aiter_frames(self, read_ahead: int = 2):
+        """
+        Asynchronous generator of the frames in frame_range for use with asyncio.
+        Frames are read by a dedicated thread so the event loop isn't blocked,
+        with up to read_ahead frames requested ahead of the consumer. When the
+        generator is closed early, eg by breaking out of async for, it waits for
+        the read in progress and moves back to the first frame not consumed.
+        """
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1)
+        pending = deque()
+        next_frame = self.frame_num
+        try:
+            while True:
+                while len(pending) < read_ahead:
+                    pending.append(loop.run_in_executor(executor, self._next_numbered_frame))
+                item = await pending.popleft()
+                if item is None:
+                    return
+                n, im = item
+                next_frame = n + self.frame_range[2]
+                yield im
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True, cancel_futures=True)
+            if (self.frame_num != next_frame) and (next_frame in range(*self.frame_range)):
+                self.set_frame(next_frame)
+
+    def _next_numbered_frame(self):
+        """private method returning (frame number, image) of the next frame or None
+        at the end of frame_range or if the frame can't be read"""
+        n = self.frame_num
+        try:
+            im = self.__next__()
+        except StopIteration:
+            return None
+        return None if im is None else (n, im)
+
     def __enter__(self):
         return self
 
@@ -336,8 +1589,88 @@ class ReadVideo:
         self.close()
 
 
+_slicerator_getitem = ReadVideo.__getitem__
+
+
+def _read_video_getitem(self, key):
+    """Ints and slices behave as for any Slicerator, slices giving a lazy view. Lists,
+    arrays and boolean masks are read straight away with read_frames."""
+    if isinstance(key, slice) or not isinstance(key, collections.abc.Iterable):
+        return _slicerator_getitem(self, key)
+    indices, _ = key_to_indices(key, len(self))
+    return self.read_frames(indices)
+
+
+ReadVideo.__getitem__ = _read_video_getitem
+
+
+class _Prefetcher:
+    """Decodes upcoming frames of a ReadVideo on a background thread.
+
+    Frames in the ReadVideo's frame_range from start_frame onwards are put
+    on a bounded queue as (frame number, ret, img), followed by None once the
+    thread has finished. Frames that fail to decode, eg past the real end of a
+    video whose frame count is an estimate, are queued with ret False as they
+    would be read synchronously. While running, the thread owns the
+    ReadVideo's vid and vid_position so the ReadVideo must call stop() before
+    touching either again.
+    """
+
+    def __init__(self, readvid, start_frame: int, maxsize: int):
+        self.readvid = readvid
+        self.next_frame = start_frame
+        self.finished = False
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        _, stop, step = self.readvid.frame_range
+        try:
+            for n in range(self.next_frame, stop, step):
+                if n != self.readvid.vid_position:
+                    self.readvid._skip_to(n)
+                ret, im = self.readvid._decode()
+                if not self._put((n, ret, im)):
+                    return
+        except Exception as error:
+            self._put(error)
+        finally:
+            self._put(None)
+
+    def _put(self, item):
+        """Blocks until item is queued, returns False if stopped first"""
+        while not self._stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self):
+        """Returns the next (frame number, ret, img). Once the thread has
+        finished this returns (next_frame, False, None) rather than waiting"""
+        item = None if self.finished else self.queue.get()
+        if item is None:
+            self.finished = True
+            item = (self.next_frame, False, None)
+        elif isinstance(item, Exception):
+            raise item
+        self.next_frame = item[0] + self.readvid.frame_range[2]
+        return item
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+        with self.queue.mutex:
+            self.queue.queue.clear()
+
+
 class WriteVideo:
-    """WriteVideo writes images to a video file using OpenCV
+    """WriteVideo writes images to a video file using OpenCV. If filename ends .lva
+    the frames are instead stored losslessly in a compressed archive, see ArchiveWriter.
 
     Attributes
     ----------
@@ -354,6 +1687,23 @@ class WriteVideo:
         frames per second playback of video
     codec : string
         used to encode file
+    stats : dict
+        scale, convert (grayscale to BGR), encode and queue_wait timings and the
+        dropped_frames count, see ReadVideo.stats. stats_callback(name, seconds),
+        if supplied, is called for every timing.
+    async_write : bool
+        If True add_frame copies the frame onto a queue and returns. A dedicated
+        encoder thread scales, converts and encodes the frames in order, so a slow
+        encode doesn't hold up capture. close() waits for the queue to be written.
+        An error on the encoder thread is raised by the next add_frame or close.
+    queue_size : int
+        maximum number of frames waiting to be encoded when async_write
+    full_policy : str
+        what add_frame does when the queue is full. 'block' (default) waits for
+        space, 'drop_oldest' discards the oldest waiting frame and 'raise' discards
+        the new frame and raises queue.Full.
+    dropped_frames : int
+        number of frames discarded because the queue was full
 
     Examples
     --------
@@ -361,10 +1711,18 @@ class WriteVideo:
     |    writevid.add_frame(img)
     |    writevid.close()
 
+    Encode on a background thread, dropping the oldest frames if it falls behind:
+
+    | with WriteVideo(filename, frame=img, async_write=True, full_policy='drop_oldest') as writevid:
+    |    for img in camera_frames:
+    |        writevid.add_frame(img)
+
     """
 
-    def __init__(self, filename, frame_size=None, frame=None, fps=50.0, codec='XVID', addtimestamp=False, scale=100):
+    def __init__(self, filename, frame_size=None, frame=None, fps=50.0, codec='XVID', addtimestamp=False, scale=100,
+                 stats_callback=None, async_write=False, queue_size=32, full_policy='block'):
         self.filename = filename
+        self._stats = Stats(stats_callback)
         self.scale = float(scale)
         self.supplied_frame_size = frame_size
         self.scaled_frame_size = frame_size
@@ -392,11 +1750,16 @@ class WriteVideo:
             _, ext = os.splitext(filename)
             filename = filename[:-len(ext)] + timestamp + ext
 
-        self.vid = cv2.VideoWriter(
-            filename,
-            fourcc,
-            fps,
-            (self.scaled_frame_size[1], self.scaled_frame_size[0]))
+        self.archive = os.path.splitext(filename)[1] in ARCHIVE_FILE_EXT
+        if self.archive:
+            self.vid = ArchiveWriter(filename, fps=fps)
+        else:
+            self.vid = cv2.VideoWriter(
+                filename,
+                fourcc,
+                fps,
+                (self.scaled_frame_size[1], self.scaled_frame_size[0]))
+        self._encoder = _Encoder(self, queue_size, full_policy) if async_write else None
 
     def _scale_frame(self, im):
         return images.resize(im, percent=self.scale)
@@ -412,19 +1775,46 @@ class WriteVideo:
         :param im: Image
         :return: None
         """
+        if self._encoder is None:
+            self._write_frame(im)
+        else:
+            # copied as the caller may reuse im, eg a camera buffer
+            self._encoder.put(np.array(im, copy=True))
+
+    def _write_frame(self, im):
+        """private method that scales, converts and encodes a frame"""
+        start = perf_counter()
         im = self._scale_frame(im)
+        self._stats.add_time('scale', perf_counter() - start)
         assert np.shape(
             im) == self.scaled_frame_size, "Added frame is wrong shape"
 
-        if self.grayscale:
+        if self.grayscale and not self.archive:
+            start = perf_counter()
             im = cv2.cvtColor(im.astype(np.uint8), cv2.COLOR_GRAY2BGR)
+            self._stats.add_time('convert', perf_counter() - start)
+        start = perf_counter()
         self.vid.write(im)
+        self._stats.add_time('encode', perf_counter() - start)
+
+    @property
+    def stats(self):
+        return self._stats.summary
+
+    @property
+    def dropped_frames(self):
+        return self._stats.counters.get('dropped_frames', 0)
 
     def close(self):
         """
-        Release video object
+        Release video object, first waiting for any queued frames to be written
         """
-        self.vid.release()
+        encoder, self._encoder = self._encoder, None
+        try:
+            if encoder is not None:
+                encoder.close()
+        finally:
+            self.vid.release()
 
     def __enter__(self):
         return self
@@ -433,6 +1823,72 @@ class WriteVideo:
         self.close()
 
 
+class _Encoder:
+    """Writes the frames added to a WriteVideo on a background thread.
+
+    Frames are taken from a bounded queue in order and passed to the
+    WriteVideo's _write_frame. If writing raises, later frames are discarded
+    and the exception is kept to be raised by the next put or close.
+    """
+    FULL_POLICIES = ('block', 'drop_oldest', 'raise')
+
+    def __init__(self, writevid, maxsize: int, full_policy: str):
+        assert full_policy in self.FULL_POLICIES, "full_policy must be 'block', 'drop_oldest' or 'raise'"
+        self.writevid = writevid
+        self.full_policy = full_policy
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            im = self.queue.get()
+            if im is None:
+                return
+            if self.error is None:
+                try:
+                    self.writevid._write_frame(im)
+                except Exception as error:
+                    self.error = error
+
+    def put(self, im):
+        """Queues a frame applying full_policy if the queue is full"""
+        self._raise_error()
+        if self.full_policy == 'block':
+            start = perf_counter()
+            self.queue.put(im)
+            self.writevid._stats.add_time('queue_wait', perf_counter() - start)
+        elif self.full_policy == 'drop_oldest':
+            while True:
+                try:
+                    self.queue.put_nowait(im)
+                    return
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                        self.writevid._stats.count('dropped_frames')
+                    except queue.Empty:
+                        pass
+        else:
+            try:
+                self.queue.put_nowait(im)
+            except queue.Full:
+                self.writevid._stats.count('dropped_frames')
+                raise
+
+    def close(self):
+        """Waits for the queued frames to be written then stops the thread"""
+        self.queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
 def suffix_generator(i, num_figs=5):
     """Creates a number suffix as string
     e.g 00005"""
@@ -450,15 +1906,188 @@ def video_to_imgs(videoname, image_filename_stub, ext='.png'):
 
     videoname   :   full path to video including extension
     image_filename_stub :   filename stub for all the images (full path)
-    ext :   type of image extension, defaults to png
+    ext :   type of image extension, defaults to png. If .lva all the images
+            are written to a single compressed archive image_filename_stub + ext
     """
 
     readvid = ReadVideo(videoname)
+    if ext in ARCHIVE_FILE_EXT:
+        with ArchiveWriter(image_filename_stub + ext, fps=readvid.fps) as archive:
+            for img in readvid:
+                archive.write(img)
+        return
+
     for i, img in enumerate(readvid):
         suffix = suffix_generator(i, num_figs=len(str(readvid.num_frames)))
         images.write_img(img, image_filename_stub + suffix + ext)
 
 
+def _segment_frame_ranges(frame_range: FrameRange, chunk: int):
+    """Splits a frame_range into contiguous frame_ranges of at most chunk frames,
+    stepping in the same direction as frame_range"""
+    frames = range(*frame_range)
+    segments = [frames[i:i + chunk] for i in range(0, len(frames), chunk)]
+    return [(segment.start, segment.stop, segment.step) for segment in segments]
+
+
+def _map_segment(filename, func, frame_range, reader_kwargs):
+    """Worker for parallel_map which opens its own reader and seeks once. The segment
+    stops at the first frame that can't be read, eg past the real end of a video"""
+    results = []
+    with ReadVideo(filename, frame_range=frame_range, **reader_kwargs) as readvid:
+        for img in readvid:
+            if img is None:
+                break
+            results.append(func(img))
+    return results
+
+
+def parallel_map(filename, func, workers=None, chunk=None, frame_range: FrameRange = (0, None, 1), **reader_kwargs):
+    """
+    Function to apply func to every frame of a video or img sequence using
+    multiple processes.
+
+    frame_range is split into contiguous segments. Each worker process opens its
+    own reader, seeks once to the start of its segment and reads sequentially.
+
+    filename    :   full path to video or img sequence
+    func        :   function taking an image. Must be picklable, ie defined at module level
+    workers     :   number of processes, defaults to os.cpu_count()
+    chunk       :   number of frames in each segment, defaults to splitting frame_range equally between workers
+    frame_range :   (start, stop, step) as in ReadVideo
+    reader_kwargs : further keyword arguments passed to ReadVideo in each worker eg grayscale
+
+    returns a list of func(img) in frame order. Frames past the real end of a video,
+    whose frame count is an estimate, are left out.
+    """
+    workers = os.cpu_count() if workers is None else workers
+    with ReadVideo(filename, frame_range=frame_range, **reader_kwargs) as readvid:
+        frame_range = readvid.frame_range
+    num_frames = len(range(*frame_range))
+    if chunk is None:
+        chunk = max(1, -(-num_frames // workers))
+    segments = _segment_frame_ranges(frame_range, chunk)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        segment_results = executor.map(_map_segment, [filename]*len(segments), [func]*len(segments),
+                                       segments, [reader_kwargs]*len(segments))
+        return [result for results in segment_results for result in results]
+
+
+def video_to_npy(videoname, npy_filename=None, frame_range: FrameRange = (0, None, 1), **reader_kwargs):
+    """
+    Function to decode a video once into a memory mapped .npy file of raw frames
+
+    Reading the .npy file with ReadVideo needs no decoding and, with copy=False,
+    each frame is a zero copy view of the memory map. The OS page cache is
+    shared by all the processes reading the file.
+
+    videoname   :   full path to video or img sequence
+    npy_filename :  full path of the .npy file, defaults to videoname with a .npy extension
+    frame_range :   (start, stop, step) of the frames to store
+    reader_kwargs : further keyword arguments passed to ReadVideo eg grayscale
+
+    If the video ends before frame_range, eg because the container's frame count is
+    an estimate, the .npy file is truncated to the frames that were read.
+
+    returns npy_filename
+    """
+    if npy_filename is None:
+        npy_filename = os.path.splitext(videoname)[0] + '.npy'
+    with ReadVideo(videoname, frame_range=frame_range, **reader_kwargs) as readvid:
+        first = readvid.read_frame(n=readvid.frame_range[0])
+        frames = np.lib.format.open_memmap(npy_filename, mode='w+', dtype=first.dtype,
+                                           shape=(len(range(*readvid.frame_range)),) + first.shape)
+        readvid.set_frame(readvid.frame_range[0])
+        num_read = len(readvid.read_batch(out=frames))
+        frames.flush()
+    num_frames = len(frames)
+    del frames
+    if num_read < num_frames:
+        _truncate_npy(npy_filename, num_read)
+    return npy_filename
+
+
+def _truncate_npy(npy_filename, num_frames):
+    """Shortens the first axis of a .npy file to num_frames in place, rewriting the
+    shape in its header, padded to the same length, and truncating the data"""
+    with open(npy_filename, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        header_start = f.tell() + (2 if version == (1, 0) else 4)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        data_start = f.tell()
+        header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': fortran_order,
+                       'shape': (num_frames,) + shape[1:]})
+        f.seek(header_start)
+        f.write(header.ljust(data_start - header_start - 1).encode('latin1') + b'\n')
+        f.truncate(data_start + num_frames*int(np.prod(shape[1:]))*dtype.itemsize)
+
+
+def _background_model(method, q):
+    if method == 'mean':
+        return MeanBackground()
+    elif method == 'median':
+        return QuantileBackground(q=0.5)
+    elif method == 'percentile':
+        return QuantileBackground(q=q/100)
+    elif method == 'mog':
+        return MOGBackground()
+    raise ValueError("method must be 'mean', 'median', 'percentile' or 'mog'")
+
+
+def _background_segment(filename, method, q, frame_range, reader_kwargs):
+    """Worker for background which streams one segment into a model. The segment
+    stops at the first frame that can't be read, eg past the real end of a video"""
+    model = _background_model(method, q)
+    with ReadVideo(filename, frame_range=frame_range, **reader_kwargs) as readvid:
+        for img in readvid:
+            if img is None:
+                break
+            model.update(img)
+    return model
+
+
+def background(filename, method='mean', sample=None, q=50, workers=1, frame_range: FrameRange = (0, None, 1),
+               **reader_kwargs):
+    """
+    Function to calculate a background image of a video or img sequence
+
+    Frames are streamed into the model one at a time so memory use doesn't grow
+    with the number of frames. median and percentile are approximate streaming
+    estimates and need uint8 frames.
+
+    filename    :   full path to video or img sequence
+    method      :   'mean', 'median', 'percentile' or 'mog' (OpenCV's MOG2 background image)
+    sample      :   approximate number of frames to use, spread evenly over frame_range. None uses every frame.
+    q           :   percentile 0-100 used by method='percentile'
+    workers     :   number of processes. frame_range is split into a segment per
+                    worker and the models of the segments are merged. 'mog' needs workers=1.
+    frame_range :   (start, stop, step) as in ReadVideo
+    reader_kwargs : further keyword arguments passed to ReadVideo eg grayscale
+
+    returns the background image
+    """
+    assert (workers == 1) or (method != 'mog'), "method 'mog' can only use 1 worker"
+    with ReadVideo(filename, frame_range=frame_range, **reader_kwargs) as readvid:
+        start, stop, step = readvid.frame_range
+    if sample is not None:
+        step *= max(1, len(range(start, stop, step)) // sample)
+    frame_range = (start, stop, step)
+
+    if workers == 1:
+        return _background_segment(filename, method, q, frame_range, reader_kwargs).result()
+
+    chunk = max(1, -(-len(range(*frame_range)) // workers))
+    segments = _segment_frame_ranges(frame_range, chunk)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        models = list(executor.map(_background_segment, [filename]*len(segments), [method]*len(segments),
+                                   [q]*len(segments), segments, [reader_kwargs]*len(segments)))
+    return models[0].merge(models[1:]).result()
+
+
 def imgs_to_video(file_filter, videoname, sort=None):
     """
     Function to assemble images into a video
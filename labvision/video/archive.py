@@ -0,0 +1,163 @@
+"""A single file archive of losslessly compressed frames.
+
+Frames are grouped into chunks which are compressed with zlib. An index of
+chunk offsets is written at the end of the file so any frame can be read by
+decompressing just the chunk containing it.
+
+File layout:
+    MAGIC | chunk 0 | chunk 1 | ... | json trailer | trailer length (8 bytes) | MAGIC
+"""
+import json
+import struct
+import zlib
+import cv2
+import numpy as np
+
+ARCHIVE_FILE_EXT = ('.lva',)
+MAGIC = b'LVARCHV1'
+
+__all__ = ['ArchiveWriter', 'ARCHIVE_FILE_EXT']
+
+
+class ArchiveWriter:
+    """ArchiveWriter writes frames to a chunked, compressed archive file
+
+    It has the same write and release methods as cv2.VideoWriter so can be used
+    by WriteVideo. All frames must have the same shape and dtype.
+
+    Attributes
+    ----------
+    filename : String
+        Full path and filename to output file, normally ending .lva
+    fps : float
+        frames per second stored in the archive for reference
+    chunk_size : int
+        number of frames compressed together. Larger chunks compress slightly
+        better but random access has to decompress more.
+    compression_level : int
+        zlib compression level 0-9. Low levels are much faster and
+        still remove most of the redundancy.
+
+    Examples
+    --------
+    | with ArchiveWriter(filename) as archive:
+    |    archive.write(img)
+
+    """
+
+    def __init__(self, filename, fps=-1, chunk_size=16, compression_level=1):
+        self.filename = filename
+        self.fps = fps
+        self.chunk_size = chunk_size
+        self.compression_level = compression_level
+        self.frame_shape = None
+        self.dtype = None
+        self.index = []
+        self.num_frames = 0
+        self._chunk = []
+        self._file = open(filename, 'wb')
+        self._file.write(MAGIC)
+
+    def write(self, im):
+        """Add a frame to the archive"""
+        if self.frame_shape is None:
+            self.frame_shape = np.shape(im)
+            self.dtype = np.asarray(im).dtype
+        assert np.shape(im) == self.frame_shape, "Added frame is wrong shape"
+        self._chunk.append(np.ascontiguousarray(im, dtype=self.dtype).tobytes())
+        self.num_frames += 1
+        if len(self._chunk) == self.chunk_size:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        data = zlib.compress(b''.join(self._chunk), self.compression_level)
+        self.index.append((self._file.tell(), len(data), self.num_frames - len(self._chunk), len(self._chunk)))
+        self._file.write(data)
+        self._chunk = []
+
+    def release(self):
+        """Write any remaining frames and the index, then close the file"""
+        if self._file.closed:
+            return
+        if self._chunk:
+            self._write_chunk()
+        trailer = json.dumps({'frame_shape': self.frame_shape,
+                              'dtype': None if self.dtype is None else self.dtype.str,
+                              'fps': self.fps,
+                              'num_frames': self.num_frames,
+                              'index': self.index}).encode()
+        self._file.write(trailer)
+        self._file.write(struct.pack('<Q', len(trailer)))
+        self._file.write(MAGIC)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class _ReadArchive:
+    """Read frames from an archive written by ArchiveWriter, is used by
+    ReadVideo in the same way as _ReadImgSeq.
+
+    The most recently decompressed chunk is kept so reading sequentially
+    decompresses each chunk once.
+    """
+
+    def __init__(self, filename: str):
+        self._file = open(filename, 'rb')
+        self._file.seek(-(8 + len(MAGIC)), 2)
+        trailer_length, = struct.unpack('<Q', self._file.read(8))
+        assert self._file.read(len(MAGIC)) == MAGIC, 'Not an archive file or file incomplete'
+        self._file.seek(-(8 + len(MAGIC) + trailer_length), 2)
+        trailer = json.loads(self._file.read(trailer_length))
+        # an archive released before any frames were written has no frame shape or dtype
+        self.frame_size = (0, 0) if trailer['frame_shape'] is None else tuple(trailer['frame_shape'])
+        self.dtype = np.dtype(trailer['dtype'] or np.uint8)
+        self.fps = trailer['fps']
+        self.num_frames = trailer['num_frames']
+        self.index = trailer['index']
+        self._chunk_starts = [first_frame for _, _, first_frame, _ in self.index]
+        self._chunk_num = None
+        self._chunk = None
+        self.current = 0
+
+    def read(self):
+        """returns a read only view of the next frame"""
+        if self.current >= self.num_frames:
+            return False, None
+        chunk_num = int(np.searchsorted(self._chunk_starts, self.current, side='right')) - 1
+        if chunk_num != self._chunk_num:
+            offset, nbytes, _, num_frames = self.index[chunk_num]
+            self._file.seek(offset)
+            data = zlib.decompress(self._file.read(nbytes))
+            self._chunk = np.frombuffer(data, dtype=self.dtype).reshape((num_frames,) + self.frame_size)
+            self._chunk_num = chunk_num
+        im = self._chunk[self.current - self._chunk_starts[chunk_num]]
+        self.current += 1
+        return True, im
+
+    def set(self, dummy, frame_num: float):
+        assert frame_num in range(self.num_frames), 'Attempted to set frame num to impossible value'
+        self.current = int(frame_num)
+
+    def get(self, property):
+        if property == cv2.CAP_PROP_POS_FRAMES:
+            return self.current
+        elif property == cv2.CAP_PROP_FRAME_COUNT:
+            return self.num_frames
+        elif property == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frame_size[1]
+        elif property == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frame_size[0]
+        elif property == cv2.CAP_PROP_FPS:
+            return self.fps
+        elif property == cv2.CAP_PROP_MONOCHROME:
+            return len(self.frame_size) == 2
+        else:
+            return -1
+
+    def release(self):
+        self._file.close()
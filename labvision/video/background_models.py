@@ -0,0 +1,115 @@
+"""Streaming background models. Each model is updated one frame at a time so
+memory use doesn't depend on the number of frames. Models for segments of a
+video can be merged which allows them to be computed in parallel."""
+from functools import partial
+import cv2
+import numpy as np
+
+__all__ = ['MeanBackground', 'QuantileBackground', 'MOGBackground', 'subtract_background']
+
+
+class MeanBackground:
+    """Mean of the frames using a running sum"""
+
+    def __init__(self):
+        self.total = None
+        self.count = 0
+        self.dtype = None
+
+    def update(self, im):
+        if self.total is None:
+            self.total = np.zeros(np.shape(im), dtype=np.float64)
+            self.dtype = im.dtype
+        self.total += im
+        self.count += 1
+
+    def merge(self, others):
+        for other in others:
+            if other.total is not None:
+                if self.total is None:
+                    self.total, self.dtype = np.zeros_like(other.total), other.dtype
+                self.total += other.total
+                self.count += other.count
+        return self
+
+    def result(self):
+        return np.round(self.total / self.count).astype(self.dtype)
+
+
+class QuantileBackground:
+    """Approximate streaming quantile of each pixel of uint8 frames
+
+    The estimate is initialised with the exact quantile of the first
+    init_frames frames. For each later frame it moves up by step*q where the
+    pixel is brighter and down by step*(1-q) where it is darker, so it settles
+    where a fraction q of the pixel values lie below it. q=0.5 gives the median.
+    """
+
+    def __init__(self, q=0.5, step=2.0, init_frames=5):
+        self.q = q
+        self.step = step
+        self.init_frames = init_frames
+        self._first_frames = []
+        self.estimate = None
+
+    def update(self, im):
+        assert im.dtype == np.uint8, 'streaming quantiles need uint8 frames'
+        if self.estimate is None:
+            self._first_frames.append(im.copy())
+            if len(self._first_frames) == self.init_frames:
+                self._initialise()
+        else:
+            brighter = im > self.estimate
+            darker = im < self.estimate
+            self.estimate += self.step*self.q*brighter
+            self.estimate -= self.step*(1 - self.q)*darker
+
+    def _initialise(self):
+        self.estimate = np.quantile(np.stack(self._first_frames), self.q, axis=0).astype(np.float32)
+        self._first_frames = []
+
+    def merge(self, others):
+        """Combines the models of different segments by taking the quantile of their estimates"""
+        estimates = [model.result() for model in [self] + list(others) if model._has_data()]
+        self._first_frames = []
+        self.estimate = np.quantile(np.stack(estimates), self.q, axis=0).astype(np.float32)
+        return self
+
+    def _has_data(self):
+        return (self.estimate is not None) or (len(self._first_frames) > 0)
+
+    def result(self):
+        if self.estimate is None:
+            self._initialise()
+        return np.clip(np.round(self.estimate), 0, 255).astype(np.uint8)
+
+
+class MOGBackground:
+    """Background image of OpenCV's Gaussian mixture background subtractor.
+    This can't be merged so has to be computed serially."""
+
+    def __init__(self):
+        self.subtractor = cv2.createBackgroundSubtractorMOG2()
+
+    def update(self, im):
+        self.subtractor.apply(im)
+
+    def merge(self, others):
+        raise NotImplementedError('MOG backgrounds can not be computed in parallel')
+
+    def result(self):
+        return self.subtractor.getBackgroundImage()
+
+
+def _subtract_background(im, background=None):
+    return cv2.absdiff(im, background)
+
+
+def subtract_background(background):
+    """
+    Returns a function which subtracts background from a frame, giving the absolute
+    difference. It can be passed to ReadVideo as return_function or used as a pipeline Stage.
+
+    background  :   image with the same shape and dtype as the frames
+    """
+    return partial(_subtract_background, background=background)
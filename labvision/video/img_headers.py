@@ -0,0 +1,110 @@
+"""Read the size, number of channels and bit depth of png, jpg and tiff
+files from their headers without decoding any pixels."""
+import struct
+
+__all__ = ['read_img_header']
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_CHANNELS = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}
+JPEG_SOF_MARKERS = (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF)
+TIFF_TAG_WIDTH = 256
+TIFF_TAG_HEIGHT = 257
+TIFF_TAG_BITS_PER_SAMPLE = 258
+TIFF_TAG_ORIENTATION = 274
+TIFF_TAG_SAMPLES_PER_PIXEL = 277
+# EXIF orientations which rotate the image by 90 degrees
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def read_img_header(filename):
+    """
+    Reads the header of a png, jpg or tiff file
+
+    filename    :   full path to the image
+
+    returns dict(width, height, channels, bit_depth) as stored in the file, or
+    None if the file isn't one of these formats or the header can't be parsed.
+    For jpgs width and height are swapped if the EXIF orientation rotates the
+    image, as cv2.imread does.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            start = f.read(8)
+            f.seek(0)
+            if start == PNG_SIGNATURE:
+                return _read_png_header(f)
+            elif start[:2] == b'\xff\xd8':
+                return _read_jpeg_header(f)
+            elif start[:4] in (b'II*\x00', b'MM\x00*'):
+                return _read_tiff_header(f)
+    except (struct.error, OSError, ValueError):
+        pass
+    return None
+
+
+def _read_png_header(f):
+    data = f.read(26)
+    width, height, bit_depth, colour_type = struct.unpack('>IIBB', data[16:26])
+    return {'width': width, 'height': height,
+            'channels': PNG_CHANNELS[colour_type], 'bit_depth': bit_depth}
+
+
+def _read_jpeg_header(f):
+    f.read(2)
+    orientation = 1
+    while True:
+        marker = f.read(2)
+        while marker[1:] == b'\xff':
+            marker = marker[1:] + f.read(1)
+        if (len(marker) < 2) or (marker[0] != 0xFF):
+            return None
+        length, = struct.unpack('>H', f.read(2))
+        if marker[1] in JPEG_SOF_MARKERS:
+            bit_depth, height, width, channels = struct.unpack('>BHHB', f.read(6))
+            if orientation in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+            return {'width': width, 'height': height,
+                    'channels': channels, 'bit_depth': bit_depth}
+        segment = f.read(length - 2)
+        if (marker[1] == 0xE1) and (segment[:6] == b'Exif\x00\x00'):
+            tags = _read_tiff_ifd(segment[6:])
+            orientation = tags.get(TIFF_TAG_ORIENTATION, 1)
+
+
+def _read_tiff_header(f):
+    # Only the first IFD is needed which is normally at the start of the file
+    data = f.read(65536)
+    tags = _read_tiff_ifd(data, f)
+    return {'width': tags[TIFF_TAG_WIDTH], 'height': tags[TIFF_TAG_HEIGHT],
+            'channels': tags.get(TIFF_TAG_SAMPLES_PER_PIXEL, 1),
+            'bit_depth': tags.get(TIFF_TAG_BITS_PER_SAMPLE, 1)}
+
+
+def _read_tiff_ifd(data, f=None):
+    """Returns {tag: first value} for the SHORT and LONG entries of the first IFD
+    of tiff formatted data. If the IFD lies beyond data it is read from f."""
+    byte_order = '<' if data[:2] == b'II' else '>'
+    offset, = struct.unpack(byte_order + 'I', data[4:8])
+    if (f is not None) and (offset + 2 > len(data)):
+        f.seek(offset)
+        data = data[:offset] + b'\x00'*(offset - len(data)) + f.read(65536)
+    num_entries, = struct.unpack(byte_order + 'H', data[offset:offset + 2])
+    tags = {}
+    for i in range(num_entries):
+        entry = data[offset + 2 + 12*i:offset + 14 + 12*i]
+        tag, field_type, count = struct.unpack(byte_order + 'HHI', entry[:8])
+        if field_type == 3:
+            value_size, fmt = 2, 'H'
+        elif field_type == 4:
+            value_size, fmt = 4, 'I'
+        else:
+            continue
+        value = entry[8:8 + value_size]
+        if count*value_size > 4:
+            value_offset, = struct.unpack(byte_order + 'I', entry[8:12])
+            if value_offset + value_size > len(data):
+                continue
+            value = data[value_offset:value_offset + value_size]
+        tags[tag], = struct.unpack(byte_order + fmt, value)
+    return tags
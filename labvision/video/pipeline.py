@@ -0,0 +1,136 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+
+__all__ = ['Pipeline', 'Stage']
+
+
+def _call_after_frame(func, args, kwargs, frame):
+    """Calls func with frame first followed by args and kwargs. Defined at module
+    level so a Stage's func can be pickled for process stages"""
+    return func(frame, *args, **kwargs)
+
+
+class Stage:
+    """A Stage is one step of a Pipeline, a function applied to each frame
+
+    Parameters
+    ----------
+    func : callable
+        takes the output of the previous stage, or a frame, as its first argument
+    workers : int
+        number of threads or processes applying func concurrently. 0 runs func
+        serially in the thread running the pipeline.
+    mode : str
+        'thread' or 'process'. Threads suit OpenCV functions, which release the GIL.
+        Processes need func and its arguments to be picklable, ie defined at module level.
+    args, kwargs :
+        further arguments passed to func after the frame
+
+    Examples
+    --------
+    Stage(images.threshold, workers=4, kwargs={'value': 100})
+
+    """
+
+    def __init__(self, func, workers=1, mode='thread', args=(), kwargs=None):
+        assert mode in ('thread', 'process'), "mode must be 'thread' or 'process'"
+        kwargs = {} if kwargs is None else kwargs
+        self.func = partial(_call_after_frame, func, tuple(args), kwargs) if (args or kwargs) else func
+        self.workers = workers
+        self.mode = mode
+
+    def executor(self):
+        """Returns a new executor for this stage or None if it runs serially"""
+        if self.workers == 0:
+            return None
+        elif self.mode == 'thread':
+            return ThreadPoolExecutor(max_workers=self.workers)
+        else:
+            return ProcessPoolExecutor(max_workers=self.workers)
+
+
+class Pipeline:
+    """Pipeline passes frames from a source through a series of stages into a sink
+
+    Each stage runs in its own pool of threads or processes, so all the stages
+    work at the same time. At most maxsize frames are queued at each stage, so a
+    slow stage holds back the ones before it rather than filling memory, and
+    results always come out in frame order.
+
+    Parameters
+    ----------
+    source : iterable or Camera
+        ReadVideo or any iterable of frames. Objects with a get_frame method,
+        eg Camera, are read num_frames times.
+    stages : list
+        Stage instances or plain functions, which become serial stages
+    sink : WriteVideo, list, callable or None
+        receives each result in order. WriteVideo.add_frame is called, lists are
+        appended to and callables are called. If None run() returns a list of the results.
+    maxsize : int
+        maximum number of frames queued or being processed at each stage
+    num_frames : int
+        number of frames to take from a Camera source
+
+    Examples
+    --------
+    | pipeline = Pipeline(ReadVideo(filename, grayscale=True, prefetch=8),
+    |                     [Stage(images.gaussian_blur, workers=4),
+    |                      Stage(images.threshold, workers=4, kwargs={'value': 100}),
+    |                      Stage(images.find_contours, workers=4)])
+    | contours = pipeline.run()
+
+    """
+
+    def __init__(self, source, stages, sink=None, maxsize=8, num_frames=None):
+        self.source = source
+        self.stages = [stage if isinstance(stage, Stage) else Stage(stage, workers=0) for stage in stages]
+        self.sink = sink
+        self.maxsize = maxsize
+        self.num_frames = num_frames
+
+    def _frames(self):
+        if hasattr(self.source, 'get_frame'):
+            assert self.num_frames is not None, 'num_frames must be supplied to read from a camera'
+            return (self.source.get_frame() for _ in range(self.num_frames))
+        return iter(self.source)
+
+    def __iter__(self):
+        """Yields the output of the final stage for each frame in order"""
+        with ExitStack() as stack:
+            results = self._frames()
+            for stage in self.stages:
+                executor = stage.executor()
+                if executor is None:
+                    results = map(stage.func, results)
+                else:
+                    stack.enter_context(executor)
+                    results = _ordered_map(executor, stage.func, results, self.maxsize)
+            yield from results
+
+    def run(self):
+        """Runs the pipeline to completion, passing every result to the sink.
+        Returns the list of results if sink is None or a list."""
+        if self.sink is None:
+            return list(self)
+        elif isinstance(self.sink, list):
+            self.sink.extend(self)
+            return self.sink
+
+        consume = self.sink.add_frame if hasattr(self.sink, 'add_frame') else self.sink
+        for result in self:
+            consume(result)
+
+
+def _ordered_map(executor, func, iterable, maxsize):
+    """Like executor.map but only takes from iterable while fewer than maxsize
+    results are outstanding"""
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= maxsize:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -0,0 +1,91 @@
+"""Counters and timing histograms which show where the time goes when reading
+or writing a video. Recording a timing costs a couple of perf_counter calls
+so they are always on."""
+import math
+import threading
+
+__all__ = ['Stats']
+
+
+class _Timing:
+    """Count, total, min and max of a series of durations and a histogram of
+    them in power of 2 microsecond bins"""
+    NUM_BINS = 32
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.bins = [0]*self.NUM_BINS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.bins[min(int(seconds*1e6).bit_length(), self.NUM_BINS - 1)] += 1
+
+    @property
+    def summary(self):
+        """Times are in seconds. histogram maps the upper edge of each non empty bin in
+        microseconds to the number of durations in it"""
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else 0.0,
+                'min': self.min if self.count else 0.0,
+                'max': self.max,
+                'histogram': {2**i: n for i, n in enumerate(self.bins) if n}}
+
+
+class Stats:
+    """Stats records named counters and timings
+
+    Parameters
+    ----------
+    callback : callable or None
+        called as callback(name, seconds) every time a timing is recorded, eg to
+        forward them to a monitoring system. Timings made on a prefetch or encoder
+        thread call it from that thread.
+
+    Counters and timings can be recorded from several threads, eg a prefetch or
+    encoder thread, while summary is read from another.
+
+    Examples
+    --------
+    | t = perf_counter()
+    | DoStuff()
+    | stats.add_time('stuff', perf_counter() - t)
+    | stats.summary['timings']['stuff']['mean']
+
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.counters = {}
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                timing = self.timings[name] = _Timing()
+            timing.add(seconds)
+        if self.callback is not None:
+            self.callback(name, seconds)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.timings = {}
+
+    @property
+    def summary(self):
+        with self._lock:
+            return {'counters': dict(self.counters),
+                    'timings': {name: timing.summary for name, timing in self.timings.items()}}
@@ -11,6 +11,7 @@ DATA_DIR = 'labvision/data'
 mp4_videopath = os.path.join(DATA_DIR, 'video/SampleVideo.mp4')
 avi_videopath = os.path.join(DATA_DIR, 'video/SampleVideo.avi')
 mkv_videopath = os.path.join(DATA_DIR, 'video/SampleVideo.mkv')
+bframe_videopath = os.path.join(DATA_DIR, 'video/SampleVideoBFrames.mp4')
 png_seqpath = os.path.join(DATA_DIR, 'pngs/SampleVideo*.png')
 jpg_seqpath = os.path.join(DATA_DIR, 'jpgs/SampleVideo*.jpg')
 tiff_seqpath = os.path.join(DATA_DIR, 'tiffs/SampleVideo*.tiff')
@@ -1,9 +1,10 @@
-from tests import mp4_videopath, avi_videopath, mkv_videopath, png_seqpath, jpg_seqpath, tiff_seqpath, single_img, vid_output_filename, DATA_DIR, rgb_img_test
+from tests import mp4_videopath, avi_videopath, mkv_videopath, bframe_videopath, png_seqpath, jpg_seqpath, tiff_seqpath, single_img, vid_output_filename, DATA_DIR, rgb_img_test
 import labvision.video as video
 import os
 import sys
 import shutil
 import pytest
+import asyncio
 import numpy as np
 
 
@@ -41,6 +42,228 @@ def test_read_cached_video_frame():
     assert np.shape(frame) == (1080, 1920, 3)
 
 
+def test_read_lru_cache():
+    """Check revisited frames come from the LRU cache and old frames are evicted to stay in budget"""
+    frame_bytes = 1080*1920*3
+    vid = video.ReadVideo(mp4_videopath, cache_bytes=3*frame_bytes)
+    first = vid.read_frame(n=1)
+    for n in [2, 3, 2, 1]:
+        frame = vid.read_frame(n=n)
+    assert np.array_equal(frame, first)
+    assert vid.frame_cache.stats['hits'] == 2
+    vid.read_frame(n=6)
+    vid.read_frame(n=7)
+    assert vid.frame_cache.stats['evictions'] == 2
+    assert vid.frame_cache.nbytes <= 3*frame_bytes
+    vid.clear_cache()
+    assert vid.frame_cache.stats['frames'] == 0
+
+
+def test_read_stats():
+    """Check decode, seek and cache timings and counts are recorded and passed to the callback"""
+    names = []
+    vid = video.ReadVideo(mp4_videopath, stats_callback=lambda name, seconds: names.append(name))
+    vid.read_frame(n=0)
+    vid.read_frame(n=0)
+    vid.read_frame(n=19)
+    stats = vid.stats
+    assert stats['timings']['decode']['count'] == 2
+    assert sum(stats['timings']['decode']['histogram'].values()) == 2
+    assert stats['timings']['seek']['count'] == 1
+    assert stats['counters']['last_frame_hits'] == 1
+    assert names.count('decode') == 2
+    vid.reset_stats()
+    assert vid.stats['timings'] == {}
+
+
+def test_stats_threads():
+    """Check stats recorded on several threads while summary is read are all counted"""
+    stats = video.Stats()
+
+    def record(thread_num):
+        for i in range(2000):
+            stats.add_time('time_%d_%d' % (thread_num, i % 50), 1e-6)
+            stats.count('frames')
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [video.threading.Thread(target=record, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            stats.summary
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    summary = stats.summary
+    assert summary['counters']['frames'] == 8000
+    assert sum(timing['count'] for timing in summary['timings'].values()) == 8000
+
+
+def test_read_frame_into():
+    """Check frames are decoded into the supplied array, including grayscale conversion"""
+    expected = video.ReadVideo(mp4_videopath).read_frame(n=4)
+    vid = video.ReadVideo(mp4_videopath)
+    out = np.empty((1080, 1920, 3), dtype=np.uint8)
+    assert vid.read_frame_into(out, n=4) is out
+    assert np.array_equal(out, expected)
+    vid = video.ReadVideo(mp4_videopath, grayscale=True, fast_grayscale=False)
+    out = np.empty((1080, 1920), dtype=np.uint8)
+    vid.read_frame_into(out, n=4)
+    assert np.array_equal(out, video.images.bgr_to_gray(expected))
+
+
+def test_read_no_copy():
+    """Check copy=False returns the cached frame rather than a copy"""
+    vid = video.ReadVideo(mp4_videopath, copy=False)
+    frame = vid.read_frame(n=2)
+    assert frame is vid.read_frame(n=2)
+
+
+def test_read_batch():
+    """Check read_batch stacks frames from a slice and refills a supplied array"""
+    expected = [img for img in video.ReadVideo(mp4_videopath)]
+    vid = video.ReadVideo(mp4_videopath)
+    batch = vid.read_batch(frames=vid[2:8])
+    assert batch.shape == (6, 1080, 1920, 3)
+    assert np.array_equal(batch, np.stack(expected[2:8]))
+    vid.set_frame(10)
+    assert vid.read_batch(n=3, out=batch) is not None
+    assert np.array_equal(batch[:3], np.stack(expected[10:13]))
+    assert vid.read_batch(frames=[]).shape == (0, 1080, 1920, 3)
+
+
+def test_read_batch_past_end():
+    """Check read_batch returns the frames before the first that can't be read on both paths"""
+    expected = [img for img in video.ReadVideo(mp4_videopath)]
+    vid = video.ReadVideo(mp4_videopath, frame_range=(15, 24, 1))
+    batch = vid.read_batch()
+    assert np.array_equal(batch, np.stack(expected[15:20]))
+    vid = video.ReadVideo(mp4_videopath, frame_range=(15, 24, 1))
+    out = np.zeros((9, 1080, 1920, 3), dtype=np.uint8)
+    assert np.array_equal(vid.read_batch(frames=[17, 22, 16], out=out), np.stack([expected[17]]))
+    assert vid.read_batch(frames=[22, 16]).shape == (0, 1080, 1920, 3)
+
+
+def test_read_fancy_index():
+    """Check list indexing returns frames in the order asked for while reading them in ascending order"""
+    expected = [img for img in video.ReadVideo(mp4_videopath)]
+    indices = [15, 3, 13, 3, 19, 4]
+    vid = video.ReadVideo(mp4_videopath, index=True)
+    frames = vid[indices]
+    assert all(np.array_equal(img, expected[n]) for n, img in zip(indices, frames))
+    assert vid.stats['timings']['decode']['count'] == 5
+    assert 'seek' not in vid.stats['timings']
+    assert np.array_equal(vid.read_batch(frames=np.array(indices)), np.stack([expected[n] for n in indices]))
+    assert isinstance(vid[2:5], video.Slicerator)
+    os.remove(mp4_videopath + '.index.npz')
+
+
+def test_read_grayscale():
+    """Check grayscale frames decoded from the luma plane match converting the BGR frame"""
+    exact = video.ReadVideo(mp4_videopath, grayscale=True).read_frame(n=3)
+    assert np.array_equal(exact, video.images.bgr_to_gray(video.ReadVideo(mp4_videopath).read_frame(n=3)))
+    frame = video.ReadVideo(mp4_videopath, grayscale=True, fast_grayscale=True).read_frame(n=3)
+    assert frame.shape == (1080, 1920)
+    assert np.mean(np.abs(frame.astype(int) - exact)) < 3
+    vid = video.ReadVideo(png_seqpath, grayscale=True)
+    assert vid.read_frame(n=0).shape == (1080, 1920)
+    assert vid.frame_size == (1080, 1920, 3)
+
+
+def test_read_grayscale_luma_quiet(capfd):
+    """Check reading the luma plane doesn't log an OpenCV warning for every frame"""
+    vid = video.ReadVideo(mp4_videopath, grayscale=True, fast_grayscale=True)
+    capfd.readouterr()
+    for _ in range(3):
+        vid.read_next_frame()
+    assert vid._luma
+    assert 'unsupported picture format' not in capfd.readouterr().err
+    vid.close()
+
+
+def test_read_grayscale_full_range():
+    """Check full range jpeg based videos aren't read from the luma plane"""
+    mjpg_filename = os.path.join(DATA_DIR, 'video/test_mjpg.avi')
+    frame = video.ReadVideo(mp4_videopath).read_frame(n=3)
+    with video.WriteVideo(mjpg_filename, frame=frame, codec='MJPG') as writevid:
+        writevid.add_frame(frame)
+    vid = video.ReadVideo(mjpg_filename, grayscale=True, fast_grayscale=True)
+    assert not vid._luma
+    assert np.array_equal(vid.read_frame(n=0), video.images.bgr_to_gray(video.ReadVideo(mjpg_filename).read_frame(n=0)))
+    vid.close()
+    os.remove(mjpg_filename)
+
+
+def test_read_downscale():
+    """Check downscaled frames are a quarter the size and close to resizing the full frame"""
+    full = video.ReadVideo(mp4_videopath).read_frame(n=2)
+    frame = video.ReadVideo(mp4_videopath, downscale=4).read_frame(n=2)
+    assert frame.shape == (270, 480, 3)
+    assert np.array_equal(frame, video.images.resize(full, percent=25))
+    vid = video.ReadVideo(jpg_seqpath, downscale=2, grayscale=True)
+    out = np.empty((540, 960), dtype=np.uint8)
+    assert vid.read_frame_into(out, n=0).shape == (540, 960)
+
+
+def test_read_roi():
+    """Check frames are cropped at read the same as cropping the full frame"""
+    roi = ((100, 40), (500, 240))
+    full = video.ReadVideo(mp4_videopath).read_frame(n=3)
+    assert np.array_equal(video.ReadVideo(mp4_videopath, roi=roi).read_frame(n=3), video.images.crop(full, roi))
+    gray = video.ReadVideo(mp4_videopath, roi=roi, grayscale=True, fast_grayscale=False)
+    assert np.array_equal(gray.read_frame(n=3), video.images.bgr_to_gray(video.images.crop(full, roi)))
+    out = np.empty((100, 200, 3), dtype=np.uint8)
+    video.ReadVideo(mp4_videopath, roi=roi, downscale=2).read_frame_into(out, n=3)
+    assert np.array_equal(out, video.images.resize(video.images.crop(full, roi), percent=50))
+    assert video.ReadVideo(png_seqpath, roi=roi, downscale=2).read_frame(n=0).shape == (100, 200, 3)
+
+
+def test_read_concatenated_videos():
+    """Check a list of videos is read as one video with global frame numbers"""
+    expected = [img for img in video.ReadVideo(mkv_videopath)]
+    vid = video.ReadVideo([mp4_videopath, mkv_videopath, mp4_videopath], index=True)
+    assert vid.num_frames == 60
+    assert np.array_equal(vid[25], expected[5])
+    assert vid.read_next_frame() is not None
+    assert len(vid.vid._captures) <= 2
+    assert len([img for img in video.ReadVideo([mp4_videopath, mkv_videopath], frame_range=(15, None, 2))]) == 13
+    for filename in [mp4_videopath, mkv_videopath]:
+        os.remove(filename + '.index.npz')
+
+
+def test_read_concatenated_videos_exact_counts():
+    """Check files with fewer frames than their container estimates don't shift later frame numbers"""
+    truncated_filename = os.path.join(DATA_DIR, 'video/test_truncated.mkv')
+    with open(mkv_videopath, 'rb') as f:
+        data = f.read()
+    with open(truncated_filename, 'wb') as f:
+        f.write(data[:len(data)//2])
+    expected = [img for img in video.ReadVideo(mp4_videopath)]
+    vid = video.ReadVideo([truncated_filename, mp4_videopath])
+    num_truncated = vid.vid.seek_indexes[0].num_frames
+    assert num_truncated < 20
+    assert vid.num_frames == num_truncated + 20
+    frames = [img for img in vid]
+    assert all(img is not None for img in frames)
+    assert np.array_equal(frames[num_truncated], expected[0])
+    assert not os.path.exists(truncated_filename + '.index.npz')
+    vid.close()
+    os.remove(truncated_filename)
+
+
+def test_read_video_wildcard_in_filename():
+    """Check an existing video whose name contains glob characters is opened rather than globbed"""
+    filename = os.path.join(DATA_DIR, 'video/run[1].mp4')
+    shutil.copy(mp4_videopath, filename)
+    with video.ReadVideo(filename) as vid:
+        assert vid.filenames == [filename]
+        assert vid.read_next_frame() is not None
+    os.remove(filename)
+
+
 def test_read_png_frames():
     """Check working with pngs"""
     vid = video.ReadVideo(png_seqpath)
@@ -48,6 +271,22 @@ def test_read_png_frames():
     assert np.shape(frame) == (1080, 1920, 3)
 
 
+def test_read_png_frames_workers():
+    """Check decoding an img sequence in a thread pool keeps the frames in order"""
+    expected = [img for img in video.ReadVideo(png_seqpath)]
+    with video.ReadVideo(png_seqpath, workers=2) as vid:
+        frames = [img for img in vid]
+        assert all(np.array_equal(a, b) for a, b in zip(expected, frames))
+        assert np.array_equal(vid.read_frame(n=1), expected[1])
+    with video.ReadVideo(png_seqpath, workers=2, frame_range=(None, None, -1)) as vid:
+        filenames = []
+        imread = vid.vid._imread
+        vid.vid._imread = lambda filename: filenames.append(filename) or imread(filename)
+        frames = [img for img in vid]
+        assert all(np.array_equal(a, b) for a, b in zip(expected[::-1], frames))
+        assert sorted(filenames) == sorted(vid.vid.files.files)
+
+
 def test_read_jpg_frames():
     """Check working with jpgs"""
     vid = video.ReadVideo(jpg_seqpath)
@@ -79,6 +318,227 @@ def test_read_frame_range():
     assert index == 4
 
 
+def test_read_prefetch():
+    """Check prefetching returns the same frames as reading synchronously, including after a seek"""
+    vid = video.ReadVideo(mp4_videopath, frame_range=(1, 10, 2))
+    expected = [img for img in vid]
+    vid = video.ReadVideo(mp4_videopath, frame_range=(1, 10, 2), prefetch=3)
+    frames = [img for img in vid]
+    assert all(np.array_equal(a, b) for a, b in zip(expected, frames))
+    assert np.array_equal(vid.read_frame(n=3), expected[1])
+    vid.close()
+
+
+def test_read_prefetch_past_end():
+    """Check prefetching past the real end of a video returns None like reading synchronously"""
+    vid = video.ReadVideo(mp4_videopath, frame_range=(15, 24, 1))
+    expected = [img is None for img in vid]
+    vid = video.ReadVideo(mp4_videopath, frame_range=(15, 24, 1), prefetch=2)
+    assert [img is None for img in vid] == expected
+    assert expected == [False]*5 + [True]*4
+    vid.close()
+
+
+def test_parallel_map():
+    """Check parallel_map returns results in frame order"""
+    vid = video.ReadVideo(mp4_videopath, frame_range=(1, 18, 2))
+    expected = [np.mean(img) for img in vid]
+    assert vid.parallel_map(np.mean, workers=2, chunk=3) == expected
+    vid = video.ReadVideo(mp4_videopath, frame_range=(None, None, -1))
+    expected = [np.mean(img) for img in video.ReadVideo(mp4_videopath)][::-1]
+    assert vid.parallel_map(np.mean, workers=2, chunk=8) == expected
+    assert video.parallel_map(mp4_videopath, np.mean, workers=2, chunk=4, frame_range=(10, 24, 1)) == expected[::-1][10:]
+
+
+def test_background():
+    """Check streaming backgrounds against the exact ones and merging segments"""
+    frames = np.stack(list(video.ReadVideo(mp4_videopath, grayscale=True)))
+    assert callable(video.background)
+    assert video.background_models.MeanBackground is video.MeanBackground
+    mean = video.background(mp4_videopath, method='mean', grayscale=True)
+    assert np.abs(mean.astype(float) - np.mean(frames, axis=0)).max() <= 0.5
+    assert np.array_equal(video.background(mp4_videopath, method='mean', workers=2, grayscale=True), mean)
+    tail = video.background(mp4_videopath, method='mean', frame_range=(10, 24, 1), grayscale=True)
+    assert np.abs(tail.astype(float) - np.mean(frames[10:], axis=0)).max() <= 0.5
+    assert np.array_equal(video.background(mp4_videopath, method='mean', workers=2, frame_range=(10, 24, 1),
+                                           grayscale=True), tail)
+    median = video.background(mp4_videopath, method='median', sample=4, grayscale=True)
+    assert np.abs(median.astype(float) - np.median(frames[::5], axis=0)).max() <= 0.5
+    low = video.background(mp4_videopath, method='percentile', q=10, grayscale=True)
+    high = video.background(mp4_videopath, method='percentile', q=90, grayscale=True)
+    assert np.mean(low <= high) > 0.99
+    subtracted = video.ReadVideo(mp4_videopath, grayscale=True, return_function=video.subtract_background(median))
+    assert subtracted.read_frame(n=0).shape == median.shape
+
+
+def test_read_active_frames():
+    """Check the activity index, its sidecar file and iterating active frames"""
+    vid = video.ReadVideo(mp4_videopath, frame_range=(0, None, 2))
+    scores = vid.activity()
+    assert len(scores) == 20 and scores[0] == 0 and np.all(scores[1:] > 0)
+    assert os.path.exists(mp4_videopath + '.activity.npz')
+    assert vid.active_ranges(threshold=0) == [(1, 20)]
+    assert vid.active_ranges(threshold=scores.max()) == []
+    active = list(vid.iter_active(threshold=0))
+    assert [n for n, _ in active] == list(range(2, 20, 2))
+    assert np.array_equal(active[0][1], video.ReadVideo(mp4_videopath).read_frame(n=2))
+    os.remove(mp4_videopath + '.activity.npz')
+
+
+def test_read_active_frames_past_end():
+    """Check the activity index only scores the frames that can be read when the frame count is an estimate"""
+    truncated_filename = os.path.join(DATA_DIR, 'video/test_truncated.mkv')
+    with open(mkv_videopath, 'rb') as f:
+        data = f.read()
+    with open(truncated_filename, 'wb') as f:
+        f.write(data[:len(data)//2])
+    vid = video.ReadVideo(truncated_filename)
+    num_read = len([img for img in vid if img is not None])
+    assert num_read < vid.num_frames
+    assert len(vid.activity()) == num_read
+    vid.close()
+    os.remove(truncated_filename + '.activity.npz')
+    os.remove(truncated_filename)
+
+
+def test_read_seek_index():
+    """Check the keyframe index is saved as a sidecar and gives frame accurate seeks"""
+    index_filename = mp4_videopath + '.index.npz'
+    if os.path.exists(index_filename):
+        os.remove(index_filename)
+    expected = [img for img in video.ReadVideo(mp4_videopath)]
+    vid = video.ReadVideo(mp4_videopath, index=True)
+    assert os.path.exists(index_filename)
+    assert vid.num_frames == 20
+    assert list(vid.seek_index.keyframes) == [0, 12]
+    for n in [15, 3, 13, 19, 0]:
+        assert np.array_equal(vid[n], expected[n])
+    vid = video.ReadVideo(mp4_videopath, index=True)
+    assert vid.seek_index.num_frames == 20
+    os.remove(index_filename)
+
+
+def test_read_sidecars_unwritable(monkeypatch):
+    """Check the seek and activity indexes are kept in memory if their sidecars can't be saved"""
+    def savez(*args, **kwargs):
+        raise PermissionError('read only')
+    monkeypatch.setattr(video.np, 'savez', savez)
+    vid = video.ReadVideo(mp4_videopath, index=True)
+    assert vid.num_frames == 20
+    assert len(vid.activity()) == 20
+    assert not os.path.exists(mp4_videopath + '.index.npz')
+    assert not os.path.exists(mp4_videopath + '.activity.npz')
+
+
+def test_read_stepped_frame_range():
+    """Check small steps are grabbed, steps longer than a GOP seek and both return the right frames"""
+    expected = [img for img in video.ReadVideo(mp4_videopath)]
+    vid = video.ReadVideo(mp4_videopath, frame_range=(1, None, 3))
+    for n, img in zip(range(1, 20, 3), vid):
+        assert np.array_equal(img, expected[n])
+    assert vid.stats['counters']['grabbed_frames'] > 0 and 'seek' not in vid.stats['timings']
+    vid = video.ReadVideo(mp4_videopath, frame_range=(0, None, 15))
+    for n, img in zip(range(0, 20, 15), vid):
+        assert np.array_equal(img, expected[n])
+    assert 'grab' not in vid.stats['timings'] and vid.stats['timings']['seek']['count'] == 1
+
+
+def test_read_set_frame_forward():
+    """Check a short forward jump grabs rather than seeks"""
+    vid = video.ReadVideo(mp4_videopath)
+    vid.read_frame(n=0)
+    assert np.array_equal(vid.read_frame(n=3), video.ReadVideo(mp4_videopath).read_frame(n=3))
+    assert 'seek' not in vid.stats['timings'] and vid.stats['counters']['grabbed_frames'] == 2
+
+
+def test_read_backwards():
+    """Check reading backwards returns the frames in reverse decoding each frame only once"""
+    expected = [img for img in video.ReadVideo(mp4_videopath)]
+    vid = video.ReadVideo(mp4_videopath, frame_range=(None, None, -1), index=True)
+    assert all(np.array_equal(img, expected[n]) for n, img in zip(range(19, -1, -1), vid))
+    assert vid.stats['timings']['decode']['count'] == 20
+    vid = video.ReadVideo(mp4_videopath, frame_range=(1, None, 3))
+    assert all(np.array_equal(img, expected[n]) for n, img in zip(range(19, 0, -3), reversed(vid)))
+    assert vid.stats['timings']['decode']['count'] == 7
+    vid = video.ReadVideo(mp4_videopath, frame_range=(None, None, -1), index=True)
+    frames = list(reversed(vid))
+    assert len(frames) == 20
+    assert all(np.array_equal(img, expected[n]) for n, img in enumerate(frames))
+    assert vid.stats['timings']['decode']['count'] == 20
+    assert 'seek' not in vid.stats['timings']
+    os.remove(mp4_videopath + '.index.npz')
+
+
+def test_read_async():
+    """Check async iteration returns every frame in frame_range"""
+    expected = [img for img in video.ReadVideo(mp4_videopath, frame_range=(1, 10, 2))]
+
+    async def read_frames():
+        return [img async for img in video.ReadVideo(mp4_videopath, frame_range=(1, 10, 2))]
+
+    frames = asyncio.run(read_frames())
+    assert len(frames) == len(expected)
+    assert all(np.array_equal(a, b) for a, b in zip(expected, frames))
+
+
+def test_read_async_break():
+    """Check breaking out of async iteration leaves the reader at the first frame not consumed"""
+    expected = [img for img in video.ReadVideo(mp4_videopath, frame_range=(1, 10, 2))]
+    vid = video.ReadVideo(mp4_videopath, frame_range=(1, 10, 2))
+
+    async def read_one_frame():
+        async for img in vid:
+            return img
+
+    assert np.array_equal(asyncio.run(read_one_frame()), expected[0])
+    assert vid.frame_num == 3
+    assert np.array_equal(vid.read_next_frame(), expected[1])
+    vid.close()
+
+
+def test_pipeline():
+    """Check a pipeline of thread and process stages returns results in frame order"""
+    expected = [np.mean(video.images.gaussian_blur(img)) for img in video.ReadVideo(mp4_videopath, frame_range=(0, 10, 1))]
+    pipeline = video.Pipeline(video.ReadVideo(mp4_videopath, frame_range=(0, 10, 1), prefetch=4),
+                              [video.Stage(video.images.gaussian_blur, workers=3),
+                               video.Stage(np.mean, workers=2, mode='process')],
+                              maxsize=4)
+    assert pipeline.run() == expected
+    results = []
+    video.Pipeline(video.ReadVideo(mp4_videopath, frame_range=(0, 10, 1)),
+                   [video.images.gaussian_blur, np.mean], sink=results).run()
+    assert results == expected
+    expected = [np.mean(img - 1, dtype=np.float64) for img in video.ReadVideo(mp4_videopath, frame_range=(0, 4, 1))]
+    pipeline = video.Pipeline(video.ReadVideo(mp4_videopath, frame_range=(0, 4, 1)),
+                              [video.Stage(np.subtract, workers=2, mode='process', args=(1,)),
+                               video.Stage(np.mean, kwargs={'dtype': np.float64})])
+    assert pipeline.run() == expected
+
+
+def test_read_timestamps():
+    """Check per frame timestamps and reading by time"""
+    vid = video.ReadVideo(mp4_videopath)
+    assert np.allclose(vid.timestamps, np.arange(20)*0.02)
+    assert np.array_equal(vid.read_time(0.105), vid.read_frame(n=5))
+    assert len(video.ReadVideo(png_seqpath).timestamps) == 4
+    assert not os.path.exists(mp4_videopath + '.index.npz')
+
+
+def test_read_timestamps_bframes():
+    """Check timestamps of variable frame rate video with B-frames are in display order"""
+    vid = video.ReadVideo(bframe_videopath)
+    expected = []
+    for img in vid:
+        if img is None:
+            break
+        expected.append(vid.vid.get(video.cv2.CAP_PROP_POS_MSEC) / 1000)
+    vid = video.ReadVideo(bframe_videopath)
+    assert np.all(np.diff(vid.timestamps) > 0)
+    assert np.allclose(vid.timestamps[:len(expected)], expected)
+    assert vid.frame_at_time(1.1) == 15
+    assert np.array_equal(vid.read_time(1.1), video.ReadVideo(bframe_videopath).read_frame(n=15))
+
+
 def test_read_framenum_too_high():
     """Check Error raised if asking for frame outside of video numframes range"""
     vid = video.ReadVideo(mp4_videopath)
@@ -100,6 +560,58 @@ def test_read_seq_props():
     assert vid.num_frames == 4
 
 
+def test_probe_img_seq():
+    """Check img sequence metadata is read from the file headers"""
+    metadata = video.probe_img_seq(tiff_seqpath, check_all=True)
+    assert (metadata['height'], metadata['width'], metadata['channels']) == (1080, 1920, 3)
+    assert metadata['bit_depth'] == 8
+    assert metadata['uniform_size']
+    vid = video.ReadVideo(png_seqpath)
+    assert vid.frame_size == (1080, 1920, 3)
+    assert vid.vid.check_frame_sizes()
+
+
+def test_video_to_npy():
+    """Check a video cached as a .npy file reads back the same frames from the memory map"""
+    npy_filename = os.path.join(DATA_DIR, 'video/test.npy')
+    expected = [img for img in video.ReadVideo(mp4_videopath, frame_range=(2, 12, 2))]
+    video.video_to_npy(mp4_videopath, npy_filename, frame_range=(2, 12, 2))
+    vid = video.ReadVideo(npy_filename, copy=False)
+    assert vid.num_frames == 5
+    assert vid.frame_size == (1080, 1920, 3)
+    frame = vid.read_frame(n=3)
+    assert np.array_equal(frame, expected[3])
+    assert isinstance(frame, np.memmap)
+    vid.close()
+    del vid, frame
+    os.remove(npy_filename)
+
+
+def test_video_to_npy_grayscale():
+    """Check a grayscale .npy file has the frame_size of its frames and can be read into a preallocated array"""
+    npy_filename = os.path.join(DATA_DIR, 'video/test.npy')
+    expected = video.ReadVideo(mp4_videopath, grayscale=True).read_frame(n=2)
+    video.video_to_npy(mp4_videopath, npy_filename, frame_range=(0, 4, 1), grayscale=True)
+    vid = video.ReadVideo(npy_filename)
+    assert vid.frame_size == (1080, 1920)
+    img = np.empty(vid.frame_size, dtype=np.uint8)
+    assert np.array_equal(vid.read_frame_into(img, n=2), expected)
+    vid.close()
+    del vid
+    os.remove(npy_filename)
+
+
+def test_video_to_npy_past_end():
+    """Check the .npy file only keeps the frames read when the video ends before frame_range"""
+    npy_filename = os.path.join(DATA_DIR, 'video/test.npy')
+    expected = [img for img in video.ReadVideo(mp4_videopath, frame_range=(15, 20, 1))]
+    video.video_to_npy(mp4_videopath, npy_filename, frame_range=(15, 24, 1))
+    frames = np.load(npy_filename)
+    assert frames.shape == (5, 1080, 1920, 3)
+    assert np.array_equal(frames, np.stack(expected))
+    os.remove(npy_filename)
+
+
 def test_read_single_img():
     """Check working with single imgs"""
     vid = video.ReadVideo(single_img)
@@ -125,6 +637,28 @@ def test_video_to_imgs():
     assert os.path.exists(test_dir + '/test02.png')
     shutil.rmtree(test_dir)
 
+def test_video_to_archive():
+    """Check frames written to an archive read back losslessly with random access"""
+    archive_stub = os.path.join(DATA_DIR, 'video/test')
+    expected = [img for img in video.ReadVideo(mp4_videopath)]
+    video.video_to_imgs(mp4_videopath, archive_stub, ext='.lva')
+    with video.ReadVideo(archive_stub + '.lva') as vid:
+        assert vid.num_frames == 20
+        assert vid.fps == 50
+        assert np.array_equal(vid[17], expected[17])
+        assert np.array_equal(vid[3], expected[3])
+    os.remove(archive_stub + '.lva')
+
+
+def test_empty_archive():
+    """Check an archive released without any frames can be reopened"""
+    archive_filename = os.path.join(DATA_DIR, 'video/test_empty.lva')
+    video.ArchiveWriter(archive_filename).release()
+    with video.ReadVideo(archive_filename) as vid:
+        assert vid.num_frames == 0
+        assert [img for img in vid] == []
+    os.remove(archive_filename)
+
 # =================================================================================
 # WriteVideo Tests #=================================================================================
 
@@ -137,6 +671,15 @@ def test_write_video():
     assert os.path.exists(vid_output_filename)
     os.remove(vid_output_filename)
 
+
+def test_write_stats():
+    """Test that WriteVideo times encoding every frame added"""
+    writevid = video.WriteVideo(vid_output_filename, frame=rgb_img_test())
+    writevid.add_frame(rgb_img_test())
+    writevid.close()
+    assert writevid.stats['timings']['encode']['count'] == 1
+    os.remove(vid_output_filename)
+
 def test_write_scaled_video():
     writevid = video.WriteVideo(vid_output_filename, frame=rgb_img_test(), scale=50)
     writevid.add_frame(rgb_img_test())
@@ -146,6 +689,34 @@ def test_write_scaled_video():
 
 
 
+def test_write_archive():
+    """Test that WriteVideo writes a grayscale archive without converting to BGR"""
+    archive_filename = os.path.join(DATA_DIR, 'video/test.lva')
+    img = video.images.bgr_to_gray(rgb_img_test())
+    with video.WriteVideo(archive_filename, frame_size=np.shape(img)) as writevid:
+        writevid.add_frame(img)
+    with video.ReadVideo(archive_filename) as vid:
+        assert vid.frame_size == np.shape(img)
+        assert vid.read_frame().shape == np.shape(img)
+    os.remove(archive_filename)
+
+
+def test_write_async():
+    """Test frames added with async_write are all written, or counted as dropped, by close"""
+    archive_filename = os.path.join(DATA_DIR, 'video/test_async.lva')
+    img = rgb_img_test()[:120, :160]
+    with video.WriteVideo(archive_filename, frame=img, async_write=True) as writevid:
+        for _ in range(5):
+            writevid.add_frame(img)
+    assert video.ReadVideo(archive_filename).num_frames == 5
+    with video.WriteVideo(archive_filename, frame=img, async_write=True, queue_size=1,
+                          full_policy='drop_oldest') as writevid:
+        for _ in range(20):
+            writevid.add_frame(img)
+    assert video.ReadVideo(archive_filename).num_frames + writevid.dropped_frames == 20
+    os.remove(archive_filename)
+
+
 def test_frame_wrong_shape_raises_error():
     """Test that error is thrown iif a frame is added with shape that is different to frame_size used in constructor"""
     writevid = video.WriteVideo(